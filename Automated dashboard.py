@@ -1,103 +1,176 @@
 import os
-import requests
-from datetime import datetime
-import pytz
-import pymysql
+import sys
+import math
+import time
+import random
+import signal
+
+from weather_api import API_BUCKET
+from weather_ingest import (
+    INGEST_MODE, INGEST_TABLES,
+    country_city, get_engine, backfill_all_cities,
+    load_last_ingested, store_live_weather_all_cities,
+    load_last_forecast, store_forecasts_all_cities
+)
+import metrics
+from metrics import timer
+from retention import apply_retention
+from leases import INGEST_SHARDS, ShardLeases, ensure_tables
+from scheduler import load_demand, tick_budget
 
 # =========================
 # CONFIGURATION
 # =========================
 
+# Database settings: MYSQL* / DB_* variables (see weather_ingest.get_engine)
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
-
-DB_CONFIG = {
-    "host": "shortline.proxy.rlwy.net",
-    "port": 46617,
-    "user": "root",
-    "password": DB_PASSWORD,
-    "database": "railway",
-    "ssl": {"check_hostname": False, "verify_mode": False}
-}
-
-CITIES = [
-    "New Delhi,IN",
-    "Chennai,IN",
-    "Mumbai,IN",
-    "Bengaluru,IN",
-    "Hyderabad,IN",
-    "Kolkata,IN",
-    "Jaipur,IN",
-    "Thiruvananthapuram,IN"
-]
-
-IST = pytz.timezone("Asia/Kolkata")
+
+# Background service timing (see run_service)
+INTERVAL_MINUTES = int(os.getenv("INTERVAL_MINUTES", "5"))
+TICK_SECONDS = int(os.getenv("INGEST_TICK_SECONDS", "60"))
+JITTER_SECONDS = int(os.getenv("INGEST_JITTER_SECONDS", "10"))
+RETENTION_EVERY_MINUTES = int(os.getenv("RETENTION_EVERY_MINUTES", "60"))
 
 # =========================
 # SAFETY CHECK
 # =========================
-if not API_KEY or not DB_PASSWORD:
+if not API_KEY:
     raise RuntimeError("Environment variables not set")
 
 # =========================
 # INGESTION
 # =========================
-def run_ingestion():
-    conn = pymysql.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    recorded_at = datetime.now(IST).replace(tzinfo=None)
-
-    for city in CITIES:
-        try:
-            response = requests.get(
-                BASE_URL,
-                params={"q": city, "appid": API_KEY},
-                timeout=10
-            )
-            data = response.json()
-
-            cursor.execute(
-                """
-                INSERT INTO weather_data (
-                    city, country, temperature_c, feels_like_c,
-                    humidity_percent, pressure_hpa, wind_speed_mps,
-                    weather_condition, weather_description, recorded_at
-                )
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """,
-                (
-                    data["name"],
-                    data["sys"]["country"],
-                    round(data["main"]["temp"] - 273.15, 2),
-                    round(data["main"]["feels_like"] - 273.15, 2),
-                    data["main"]["humidity"],
-                    data["main"]["pressure"],
-                    data["wind"]["speed"],
-                    data["weather"][0]["main"],
-                    data["weather"][0]["description"],
-                    recorded_at
-                )
-            )
-
-            print(f"Inserted {data['name']}")
-
-        except Exception as e:
-            print(f"Error for {city}: {e}")
+def run_ingestion(mode=INGEST_MODE, registry=country_city, engine=None,
+                  tables=None):
+    """
+    One pass over every city: fetched once, written to weather_history
+    and weather_data (INGEST_TABLES) in one transaction.
+
+    Stalest cities go first; past the rate limit, calls wait for a token
+    instead of cities being skipped.
+    """
+    engine = engine or get_engine()
+    API_BUCKET.share(engine)
+    label = ",".join(INGEST_TABLES if tables is None else tables)
+    with timer("ingest_run", table=label):
+        # interval 0 → every city is due, ordered by last ingestion
+        return store_live_weather_all_cities(
+            engine, registry, API_KEY, 0, mode=mode,
+            last_seen=load_last_ingested(engine), tables=tables, budget=math.inf
+        )
 
-    # 7-day retention
-    cursor.execute(
-        "DELETE FROM weather_data WHERE recorded_at < NOW() - INTERVAL 7 DAY"
-    )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+# =========================
+# BACKGROUND SERVICE
+# =========================
+def run_service():
+    """
+    Runs ingestion forever so the dashboard only has to read.
+
+    Every tick (TICK_SECONDS +/- JITTER_SECONDS) the per-city
+    INTERVAL_MINUTES gap check decides which cities are due; each due
+    city is fetched once and written to weather_history and weather_data
+    together. Forecasts older than FORECAST_INTERVAL_MINUTES are
+    replaced and retention runs once per RETENTION_EVERY_MINUTES.
+
+    Stage timings are served on METRICS_PORT and/or rewritten to
+    METRICS_FILE after every tick.
+
+    With INGEST_SHARDS > 0 any number of copies can run: each one only
+    ingests the cities of the shards it currently leases (see leases.py),
+    and only the holder of shard 0 runs retention.
+    """
+    metrics.start_server()
+    engine = get_engine()
+    # Every worker (and the dashboard) spends one shared API budget
+    API_BUCKET.share(engine)
+
+    leases = None
+    if INGEST_SHARDS > 0:
+        ensure_tables(engine)
+        leases = ShardLeases(engine)
+        leases.heartbeat()
+
+    def owned_registry():
+        return leases.filter_registry(country_city) if leases else country_city
+
+    backfill_all_cities(engine, owned_registry())
+
+    # Last-ingested indexes: loaded once, then kept current in-process
+    last_seen = load_last_ingested(engine)
+    last_forecast = load_last_forecast(engine)
+    owned = leases.owned if leases else None
+    next_retention = 0.0
+
+    try:
+        while True:
+            if leases:
+                try:
+                    leases.heartbeat()
+                except Exception as e:
+                    # Can't prove ownership → ingest nothing this tick
+                    print(f"Lease heartbeat failed: {e}")
+                    leases.owned = set()
+                if leases.owned != owned:
+                    # Cities handed over by another worker: pick up its progress
+                    owned = leases.owned
+                    last_seen = load_last_ingested(engine)
+                    last_forecast = load_last_forecast(engine)
+                    print(f"Now ingesting shards {sorted(owned)}")
+
+            demand = load_demand(engine)
+            # The whole tick's refill, not just the burst on hand; calls
+            # wait for their tokens. A share is kept for forecasts.
+            live_budget, forecast_budget = tick_budget(
+                TICK_SECONDS, workers=leases.live if leases else 1
+            )
+            try:
+                with timer("ingest_run", table=",".join(INGEST_TABLES)):
+                    # One fetch per due city → every table, one transaction.
+                    # Watched cities first, idle ones back off (scheduler.py)
+                    store_live_weather_all_cities(
+                        engine, owned_registry(), API_KEY, INTERVAL_MINUTES,
+                        last_seen=last_seen, demand=demand, budget=live_budget
+                    )
+            except Exception as e:
+                print(f"Live weather ingestion failed: {e}")
+
+            # Forecasts: one /forecast call per city per 3 hours
+            try:
+                with timer("ingest_run", table="weather_forecast"):
+                    store_forecasts_all_cities(
+                        engine, owned_registry(), API_KEY,
+                        last_fetched=last_forecast, demand=demand,
+                        budget=forecast_budget
+                    )
+            except Exception as e:
+                print(f"weather_forecast ingestion failed: {e}")
+
+            retention_here = leases is None or 0 in leases.owned
+            if retention_here and time.monotonic() >= next_retention:
+                try:
+                    apply_retention(engine)
+                except Exception as e:
+                    print(f"Retention failed: {e}")
+                next_retention = time.monotonic() + RETENTION_EVERY_MINUTES * 60
+
+            metrics.write_textfile()
+
+            # Jitter keeps several service instances from hitting the API in lockstep
+            time.sleep(max(1, TICK_SECONDS + random.uniform(-JITTER_SECONDS, JITTER_SECONDS)))
+    finally:
+        if leases:
+            leases.release_all()
 
 # =========================
 # ENTRY POINT
 # =========================
 if __name__ == "__main__":
-    run_ingestion()
+    if "--service" in sys.argv:
+        # SIGTERM → SystemExit, so shard leases are released on shutdown
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        run_service()
+    else:
+        engine = get_engine()
+        run_ingestion(engine=engine)
+        apply_retention(engine, ["weather_data", "weather_history"])
+        metrics.write_textfile()
@@ -0,0 +1,342 @@
+"""
+Offline benchmark suite.
+
+Runs everything against mock_openweather.py and a local SQLite file, so it
+needs no API key, network or MySQL:
+
+    python benchmark.py                            # 27 cities, 7 days of history
+    python benchmark.py --cities 500 --history-days 30 --per-day 96
+    python benchmark.py --out bench.json --skip-app
+
+Timed: run_ingestion (weather_history + weather_data in one pass),
+store_live_weather_all_cities (city + group mode),
+store_forecasts_all_cities, each dashboard loader and full dashboard_app.py
+runs of every page (Home, Data, Graph) under Streamlit's AppTest. A fresh interpreter also imports the dashboard's modules under
+-X importtime to profile cold-start cost. Results, plus the per-stage
+metrics.summary() for the whole run, are written as JSON so runs can be
+diffed between commits.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE weather_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country TEXT NOT NULL, city TEXT NOT NULL,
+        Temperature REAL, humidity REAL, wind REAL,
+        Dates_times TIMESTAMP NOT NULL, day_part INTEGER
+    )
+    """,
+    "CREATE INDEX idx_history_country_city_time ON weather_history (country, city, Dates_times)",
+    "CREATE INDEX idx_history_country_city_part_time"
+    " ON weather_history (country, city, day_part, Dates_times)",
+    "CREATE INDEX idx_history_time ON weather_history (Dates_times)",
+    """
+    CREATE TABLE weather_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        city TEXT NOT NULL, country TEXT NOT NULL,
+        temperature_c REAL, feels_like_c REAL,
+        humidity_percent INTEGER, pressure_hpa INTEGER, wind_speed_mps REAL,
+        weather_condition TEXT, weather_description TEXT,
+        recorded_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE weather_hourly (
+        country TEXT NOT NULL, city TEXT NOT NULL, hour_start TIMESTAMP NOT NULL,
+        n INTEGER NOT NULL, temp_sum REAL NOT NULL,
+        temp_min REAL NOT NULL, temp_max REAL NOT NULL,
+        PRIMARY KEY (country, city, hour_start)
+    )
+    """,
+    """
+    CREATE TABLE weather_forecast (
+        country TEXT NOT NULL, city TEXT NOT NULL, forecast_time TIMESTAMP NOT NULL,
+        temperature REAL NOT NULL, day_part INTEGER NOT NULL,
+        fetched_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (country, city, forecast_time)
+    )
+    """,
+    """
+    CREATE TABLE weather_daily (
+        country TEXT NOT NULL, city TEXT NOT NULL, day DATE NOT NULL,
+        n INTEGER NOT NULL, temp_sum REAL NOT NULL,
+        temp_min REAL NOT NULL, temp_max REAL NOT NULL,
+        PRIMARY KEY (country, city, day)
+    )
+    """,
+]
+
+
+# -------------------------------------------------
+# HELPERS
+# -------------------------------------------------
+def time_it(results, name, fn, repeat):
+    """Runs fn `repeat` times and records wall times in seconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+
+    results[name] = {
+        "runs": [round(r, 6) for r in runs],
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+        "max": round(max(runs), 6),
+    }
+    print(f"{name:<45} median {results[name]['median'] * 1000:9.1f} ms")
+
+def build_registry(n):
+    """First n real cities, padded with synthetic ones for large runs."""
+    from weather_ingest import country_city
+
+    registry, count = {}, 0
+    for country, info in country_city.items():
+        for city in info["cities"]:
+            if count == n:
+                return registry
+            registry.setdefault(country, {"code": info["code"], "cities": []})
+            registry[country]["cities"].append(city)
+            count += 1
+
+    registry["Benchland"] = {
+        "code": "BL", "cities": [f"City {i:05d}" for i in range(n - count)]
+    }
+    return registry
+
+def seed_history(engine, registry, days, per_day):
+    """Writes `days` of readings per city through the normal batch writer."""
+    import numpy as np
+    from weather_ingest import IST, history_writer
+
+    now = datetime.now(IST)
+    step = timedelta(days=1) / per_day
+    rng = np.random.default_rng(0)
+
+    with engine.begin() as conn, history_writer(conn, batch_size=1000) as writer:
+        for country, info in registry.items():
+            for city in info["cities"]:
+                for i in range(days * per_day):
+                    writer.add({
+                        "country": country, "city": city,
+                        "temperature": float(rng.uniform(15, 35)),
+                        "humidity": float(rng.uniform(40, 90)),
+                        "wind": float(rng.uniform(1, 8)),
+                        "dt": now - step * (i + 1),
+                    })
+
+def load_automated_dashboard():
+    """Imports 'Automated dashboard.py' (the file name has a space)."""
+    spec = importlib.util.spec_from_file_location(
+        "automated_dashboard", os.path.join(HERE, "Automated dashboard.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# What dashboard_app.py imports before its first element renders
+DASHBOARD_IMPORTS = [
+    "streamlit", "pandas", "metrics", "weather_api", "charts",
+    "weather_ingest", "weather_queries",
+]
+
+# Reported individually when they show up in the profile
+HEAVY_MODULES = [
+    "streamlit", "pandas", "numpy", "sqlalchemy", "requests",
+    "matplotlib", "pyarrow", "pyarrow.dataset", "dotenv",
+]
+
+def import_profile(modules=DASHBOARD_IMPORTS):
+    """
+    Imports `modules` in a fresh interpreter with -X importtime.
+    Returns total wall time plus cumulative ms per app/heavy module
+    (absent = not imported at startup).
+    """
+    code = (
+        "import time; t = time.perf_counter(); "
+        + "; ".join(f"import {m}" for m in modules)
+        + "; print(time.perf_counter() - t)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+
+    watched = set(modules) | set(HEAVY_MODULES)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|")
+        name = name.strip()
+        if name in watched and cum.strip().isdigit():
+            cumulative.setdefault(name, round(int(cum) / 1000, 1))
+
+    total_ms = round(float(proc.stdout.strip().splitlines()[-1]) * 1000, 1)
+    print(f"{'import_profile[dashboard]':<45} total  {total_ms:9.1f} ms")
+    return {"total_ms": total_ms, "modules_ms": cumulative}
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -------------------------------------------------
+# SUITE
+# -------------------------------------------------
+def run(args):
+    import mock_openweather
+
+    server, base_url = mock_openweather.serve_in_thread(latency=args.latency)
+    workdir = tempfile.mkdtemp(prefix="weather-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+
+    # Must be set before the app modules read their configuration
+    os.environ.update({
+        "OPENWEATHER_BASE_URL": base_url,
+        "OPENWEATHER_API_KEY": "bench",
+        "DB_PASSWORD": "bench",
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "CITY_ID_CACHE": os.path.join(workdir, "city_ids.json"),
+        "RATE_LIMIT_PER_MINUTE": "0",   # time the code, not the quota
+    })
+    sys.path.insert(0, HERE)
+
+    imports = import_profile()
+
+    import weather_api
+    import weather_queries
+    from sqlalchemy import text
+    from scheduler import VIEWS_SCHEMA
+    from weather_ingest import (
+        get_engine, store_live_weather_all_cities, store_forecasts_all_cities
+    )
+
+    engine = get_engine()
+    with engine.begin() as conn:
+        for statement in SQLITE_SCHEMA + VIEWS_SCHEMA:
+            conn.execute(text(statement))
+
+    registry = build_registry(args.cities)
+    country = next(iter(registry))
+    city = registry[country]["cities"][0]
+    compare = registry[country]["cities"][1:6]
+    results = {}
+
+    time_it(results, "seed_history", lambda: seed_history(
+        engine, registry, args.history_days, args.per_day), 1)
+
+    # Ingestion (interval 0 → every city is due on every run): one table,
+    # then the single pass that feeds weather_history + weather_data
+    for mode in ["city", "group"]:
+        time_it(results, f"store_live_weather_all_cities[{mode}, weather_history]",
+                lambda: store_live_weather_all_cities(
+                    engine, registry, "bench", 0, mode=mode, last_seen={},
+                    tables=["weather_history"]), args.repeat)
+
+    automated = load_automated_dashboard()
+    for mode in ["city", "group"]:
+        time_it(results, f"run_ingestion[{mode}]",
+                lambda: automated.run_ingestion(
+                    mode=mode, registry=registry, engine=engine), args.repeat)
+
+    # Dashboard loaders
+    time_it(results, "get_past_week",
+            lambda: weather_queries.get_past_week(engine, country, city), args.repeat)
+    time_it(results, "get_today_weather",
+            lambda: weather_queries.get_today_weather(engine, country, city), args.repeat)
+    time_it(results, "get_today_weather_many",
+            lambda: weather_queries.get_today_weather_many(
+                engine, country, [city, *compare]), args.repeat)
+    time_it(results, "get_past_daily_avg",
+            lambda: weather_queries.get_past_daily_avg(engine, country, city), args.repeat)
+
+    # Forecasts: API fallback (nothing stored yet), then the stored table
+    code = registry[country]["code"]
+    time_it(results, "get_forecast[api, cold]",
+            lambda: (weather_api.RESPONSE_CACHE.clear(),
+                     weather_queries.get_forecast(engine, country, city, code)), args.repeat)
+    time_it(results, "store_forecasts_all_cities",
+            lambda: store_forecasts_all_cities(
+                engine, registry, "bench", interval_minutes=0), args.repeat)
+    time_it(results, "get_forecast[db]",
+            lambda: weather_queries.get_forecast(engine, country, city, code), args.repeat)
+    time_it(results, "get_future_daily_avg[db]",
+            lambda: weather_queries.get_future_daily_avg(engine, country, city, code), args.repeat)
+
+    # Full script run under AppTest (first run pays imports and cold caches)
+    if not args.skip_app:
+        from streamlit.testing.v1 import AppTest
+
+        def app_run(page="home"):
+            # AppTest opens the default page only: make each one the default
+            os.environ["DASHBOARD_DEFAULT_PAGE"] = page
+            at = AppTest.from_file(os.path.join(HERE, "dashboard_app.py"), default_timeout=120)
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+
+        time_it(results, "dashboard_app[first run]", app_run, 1)
+        for page in ["home", "data", "graph"]:
+            time_it(results, f"dashboard_app[{page}]", lambda: app_run(page), args.repeat)
+
+    server.shutdown()
+
+    import metrics
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "cities": args.cities,
+            "history_days": args.history_days,
+            "per_day": args.per_day,
+            "repeat": args.repeat,
+            "mock_latency_s": args.latency,
+        },
+        "results": results,
+        "imports": imports,
+        # Per-stage breakdown (http / sql / chart_render / ingest_*) across the whole run
+        "stages": metrics.summary(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline weather dashboard benchmarks")
+    parser.add_argument("--cities", type=int, default=27)
+    parser.add_argument("--history-days", type=int, default=7)
+    parser.add_argument("--per-day", type=int, default=24, help="readings per city per day")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="simulated API latency per request (seconds)")
+    parser.add_argument("--skip-app", action="store_true", help="skip the AppTest run")
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
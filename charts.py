@@ -0,0 +1,185 @@
+"""
+Declarative, cached chart rendering for the dashboard trend plots.
+
+A chart is a plain dict spec:
+
+    {
+        "title": "...", "xlabel": "...", "ylabel": "...",
+        "style": "seaborn-v0_8", "theme": "light" | "dark",
+        "max_ticks": 7,
+        "series": [{"data": df, "x": "col", "y": "col", "color": "#FF6F00",
+                    "fill": {...}, "band": {...}, "glow": True, ...}],
+        "extrema": {"size": 100, "labels": True, "annotate": False},
+    }
+
+render_chart(spec) draws every series exactly once and returns PNG bytes.
+Results are cached by a hash of the spec and its frames, so an unchanged
+chart costs a dictionary lookup on the next rerun.
+"""
+import os
+import io
+import json
+import hashlib
+import pandas as pd
+
+from metrics import timer
+from weather_api import ResponseCache
+
+
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "64"))
+
+CHART_CACHE = ResponseCache(max_entries=CHART_CACHE_SIZE)
+
+# Keyword arguments passed straight through to Axes.plot
+_LINE_KEYS = [
+    "color", "linewidth", "linestyle", "marker", "markersize",
+    "markerfacecolor", "markeredgecolor", "markeredgewidth", "label",
+]
+
+_THEMES = {
+    "light": {"axes": "#f9f9f9", "figure": "white", "text": None, "legend": {}},
+    "dark": {
+        "axes": "#0E1117", "figure": "#0E1117", "text": "white",
+        "legend": {"facecolor": "#1f2933", "edgecolor": "white", "labelcolor": "white"},
+    },
+}
+
+
+# -------------------------------------------------
+# CACHE KEY
+# -------------------------------------------------
+def _frame_digest(df):
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + ",".join(map(str, df.columns)).encode()).hexdigest()
+
+def chart_key(spec):
+    """Stable hash of a spec; DataFrames are reduced to content digests."""
+    def encode(value):
+        if isinstance(value, pd.DataFrame):
+            return {"__frame__": _frame_digest(value)}
+        if isinstance(value, dict):
+            return {k: encode(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(v) for v in value]
+        return value
+
+    payload = json.dumps(encode(spec), sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+# -------------------------------------------------
+# RENDERING
+# -------------------------------------------------
+def _draw_series(ax, series, patheffects):
+    df = series["data"]
+    x, y = df[series["x"]], df[series["y"]]
+    line_kwargs = {k: series[k] for k in _LINE_KEYS if k in series}
+
+    band = series.get("band")
+    if band:
+        ax.fill_between(
+            x, y - band["width"], y + band["width"],
+            color=band["color"], alpha=band["alpha"], label=band.get("label")
+        )
+
+    fill = series.get("fill")
+    if fill:
+        base = y.min() - fill["below_min"] if "below_min" in fill else 0
+        ax.fill_between(x, y, base, color=fill["color"], alpha=fill["alpha"])
+
+    if series.get("glow"):
+        # One artist: soft strokes under the line instead of repeated plots
+        line_kwargs["path_effects"] = [
+            patheffects.Stroke(linewidth=lw, foreground=series["color"], alpha=0.08)
+            for lw in (12, 10, 8, 6, 4)
+        ] + [patheffects.Normal()]
+
+    ax.plot(x, y, **line_kwargs)
+
+def _draw_extrema(ax, series, options):
+    df = series["data"]
+    x, y = df[series["x"]], df[series["y"]]
+    size = options.get("size", 100)
+    labels = options.get("labels", True)
+
+    for kind, color, value, offset in [
+        ("Max", "red", y.max(), 12),
+        ("Min", "blue", y.min(), -18),
+    ]:
+        points = df[y == value]
+        ax.scatter(
+            points[series["x"]], points[series["y"]],
+            color=color, s=size, zorder=5,
+            label=f"{kind} Temp" if labels else None
+        )
+        if options.get("annotate"):
+            at = x[y == value].iloc[0]
+            ax.annotate(
+                f"{kind} {value:.1f}°C", (at, value),
+                xytext=(0, offset), textcoords="offset points",
+                ha="center", fontsize=10, fontweight="bold", color=color
+            )
+
+def draw_chart(spec):
+    """Builds the matplotlib Figure for a spec (no pyplot global state)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import patheffects, style
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MaxNLocator
+
+    theme = _THEMES[spec.get("theme", "light")]
+
+    with style.context(spec.get("style", "seaborn-v0_8")):
+        fig = Figure(figsize=spec.get("figsize", (12, 5)))
+        ax = fig.subplots()
+
+        for series in spec["series"]:
+            _draw_series(ax, series, patheffects)
+
+        if "extrema" in spec:
+            _draw_extrema(ax, spec["series"][0], spec["extrema"])
+
+        ax.set_title(
+            spec.get("title", ""),
+            fontsize=spec.get("title_size", 15),
+            fontweight="bold",
+            pad=spec.get("title_pad", 6)
+        )
+        ax.set_xlabel(spec.get("xlabel", ""), fontsize=11)
+        ax.set_ylabel(spec.get("ylabel", ""), fontsize=11)
+
+        if spec.get("grid", True):
+            ax.grid(True, linestyle="--", alpha=0.6)
+        ax.set_facecolor(theme["axes"])
+        fig.patch.set_facecolor(theme["figure"])
+        if theme["text"]:
+            ax.tick_params(colors=theme["text"])
+            ax.xaxis.label.set_color(theme["text"])
+            ax.yaxis.label.set_color(theme["text"])
+            ax.title.set_color(theme["text"])
+
+        ax.legend(**theme["legend"])
+
+        ax.xaxis.set_major_locator(MaxNLocator(spec.get("max_ticks", 7)))
+        for label in ax.get_xticklabels():
+            label.set_rotation(45)
+            label.set_ha("right")
+
+        fig.tight_layout()
+
+    return fig
+
+def render_chart(spec, fmt="png", dpi=100):
+    """
+    PNG (or SVG) bytes for a spec, served from CHART_CACHE when the
+    spec and its data are unchanged.
+    """
+    def render():
+        with timer("chart_render", fmt=fmt):
+            fig = draw_chart(spec)
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=dpi, facecolor=fig.get_facecolor())
+            return buf.getvalue()
+
+    return CHART_CACHE.get((chart_key(spec), fmt, dpi), render, ttl=float("inf"))
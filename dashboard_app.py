@@ -1,41 +1,45 @@
 import os
-from dotenv import load_dotenv
-from urllib.parse import quote_plus
+import time
 import streamlit as st
 import pandas as pd
-import numpy as np
-import requests
-import matplotlib.pyplot as plt
 from datetime import datetime
-import time
-from sqlalchemy import create_engine, text
-from datetime import timezone, timedelta
 import streamlit.components.v1 as components
 
+# Shared with the ingestion service ("Automated dashboard.py")
+import metrics
+from scheduler import flush_views, record_views
+from weather_api import API_BUCKET, ApiError, get_current_weather_json
+from charts import render_chart
+from weather_ingest import IST, API_KEY, country_city, get_engine
+from weather_queries import (
+    get_past_week, get_today_weather, get_today_weather_many, get_past_daily_avg,
+    get_today_stats, get_watermark, get_forecast, get_future_daily_avg, DAY_PARTS
+)
 
-IST = timezone(timedelta(hours=5, minutes=30))
 # -------------------------------------------------
-# LOAD ENV (LOCAL + STREAMLIT + RAILWAY SAFE)
+# DATABASE (read-only: ingestion runs in the background service)
 # -------------------------------------------------
-load_dotenv()
-
-db_user = os.getenv("MYSQLUSER") or os.getenv("DB_USER")
-raw_password = os.getenv("MYSQLPASSWORD") or os.getenv("DB_PASSWORD")
-db_host = os.getenv("MYSQLHOST") or os.getenv("DB_HOST")
-db_port = os.getenv("MYSQLPORT") or os.getenv("DB_PORT")
-db_name = os.getenv("MYSQLDATABASE") or os.getenv("DB_NAME")
-
-if not all([db_user, raw_password, db_host, db_port, db_name]):
+# One engine + connection pool per process, shared by every session and
+# rerun (a failed attempt is not cached, so fixing the env recovers)
+@st.cache_resource(show_spinner=False)
+def shared_engine():
+    engine = get_engine()
+    # One API budget with the ingestion service and its workers
+    API_BUCKET.share(engine)
+    return engine
+
+try:
+    engine = shared_engine()
+except RuntimeError:
     st.error("❌ Database environment variables are missing")
     st.stop()
 
-db_port = int(db_port)
-db_password = quote_plus(raw_password)
+# Stage timings (HTTP, SQL, chart renders) on METRICS_PORT, if set
+metrics.start_server()
+page_started = time.perf_counter()
 
-engine = create_engine(
-    f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}",
-    pool_pre_ping=True
-)
+# Per-stage p50/p95 panel: DEBUG_METRICS=1 or ?debug=1
+DEBUG_METRICS = os.getenv("DEBUG_METRICS") == "1"
 
 # -------------------------------------------------
 # PAGE CONFIG
@@ -45,46 +49,6 @@ st.set_page_config(
     page_icon="🌦️",
     layout="wide"
 )
-# 🔴 ADDED: CSS page navigation
-st.markdown("""
-<style>
-.page { display: none; }
-.page.default { display: block; }
-
-#home:target,
-#data:target,
-#graph:target {
-    display: block;
-}
-
-.nav {
-    display: flex;
-    gap: 20px;
-    margin-bottom: 25px;
-}
-.nav a {
-    text-decoration: none;
-    padding: 10px 22px;
-    background: #1e3c72;
-    color: white;
-    border-radius: 12px;
-    font-weight: bold;
-}
-.nav a:hover {
-    background: #2a5298;
-}
-</style>
-""", unsafe_allow_html=True)
-
-# 🔴 ADDED: Top navigation bar
-st.markdown("""
-<div class="nav">
-  <a href="#home">🏠 Home</a>
-  <a href="#data">📊 Data View</a>
-  <a href="#graph">📈 Graph View</a>
-</div>
-""", unsafe_allow_html=True)
-
 # -------------------------------------------------
 # BACKGROUND BASED ON TEMPERATURE
 # -------------------------------------------------
@@ -128,38 +92,6 @@ def set_bg_by_temp(temp, condition):
         </style>
     """, unsafe_allow_html=True)
 
-# -------------------------------------------------
-# COUNTRY & CITY DATA
-# -------------------------------------------------
-country_city = {
-    "India": {
-        "code": "IN",
-        "cities": [
-            "Bangalore", "Delhi", "Mumbai", "Chennai", "Hyderabad",
-            "Kolkata", "Pune", "Ahmedabad", "Jaipur", "Trichy"
-        ]
-    },
-
-    "USA": {
-        "code": "US",
-        "cities": [
-            "New York", "Los Angeles", "Chicago", "Houston", "Phoenix",
-            "San Francisco", "San Diego", "Dallas", "Seattle", "Boston"
-        ]
-    },
-
-    "UK": {
-        "code": "GB",
-        "cities": [
-            "London", "Manchester", "Birmingham", "Liverpool",
-            "Leeds", "Bristol", "Nottingham"
-        ]
-    }
-
-
-}
-
-
 # -------------------------------------------------
 # SIDEBAR
 # -------------------------------------------------
@@ -182,24 +114,26 @@ compare_cities = st.sidebar.multiselect(
     default=[]
 )
 
-
-INTERVAL_MINUTES = REFRESH_INTERVAL//60
-
-API_KEY = os.getenv("OPENWEATHER_API_KEY") or "YOUR_API_KEY"
-
 # -------------------------------------------------
 # WEATHER API
 # -------------------------------------------------
+# A render never blocks long on the shared API budget
+API_TOKEN_WAIT_SECONDS = 2
+
 def get_current_weather(city, country_code):
-    res = requests.get(
-        f"https://api.openweathermap.org/data/2.5/weather"
-        f"?q={city},{country_code}&appid={API_KEY}&units=metric"
-    ).json()
+    try:
+        res = get_current_weather_json(city, country_code, API_KEY, wait=API_TOKEN_WAIT_SECONDS)
+    except ApiError as e:    # no token, network error or bad body
+        st.error(f"Weather service unavailable, try again shortly ({e})")
+        st.stop()
 
     if "main" not in res:
         st.error(res.get("message","API Error"))
         st.stop()
 
+    # auto_refresh reruns the app when the cache hands out a newer response
+    st.session_state["current_res"] = res
+
     return {
         "temperature": res["main"]["temp"],
         "humidity": res["main"]["humidity"],
@@ -207,213 +141,37 @@ def get_current_weather(city, country_code):
         "condition": res["weather"][0]["description"]
     }
 
-def get_forecast(city, country_code):
-    res = requests.get(
-        f"https://api.openweathermap.org/data/2.5/forecast"
-        f"?q={city},{country_code}&appid={API_KEY}&units=metric"
-    ).json()
-
-    rows = []
-    for item in res["list"]:
-        rows.append({
-            "Date & Time": (
-                    datetime.fromtimestamp(item["dt"], tz=timezone.utc).astimezone(IST).replace(tzinfo=None) ),
-            "Temperature (°C)": item["main"]["temp"]
-        })
-
-    return pd.DataFrame(rows)
-# -------------------------------------------------
-# DATABASE FUNCTIONS
-# -------------------------------------------------
-def insert_sample_past_data(engine, country, city):
-    with engine.begin() as conn:
-        result = conn.execute(
-            text("""
-                SELECT COUNT(*) FROM weather_history
-                WHERE country=:country AND city=:city
-            """),
-            {"country": country, "city": city}
-        ).scalar()
-        print(result)
-
-        if result > 5:
-            return
-        for day in range(7, 0, -1):
-            base_date = datetime.now(IST) - pd.Timedelta(days=day)
-
-            for hour in [0, 6, 12, 18]:      # 4 records per day (every 6 hours)
-                record_time = base_date.replace(
-                    hour=hour,
-                    minute=0,
-                    second=0,
-                    microsecond=0
-                )
-
-                conn.execute(
-                    text("""
-                        INSERT INTO weather_history
-                        (country, city, Temperature, humidity, wind, Dates_times)
-                        VALUES (:country, :city, :temp, :hum, :wind, :time)
-                    """),
-                    {
-                        "country": country,
-                        "city": city,
-                        "temp": np.random.uniform(22, 32),
-                        "hum": np.random.uniform(50, 80),
-                        "wind": np.random.uniform(2, 6),
-                        "time": record_time
-                    }
-                )
-
-def store_live_weather_all_cities(engine, country_city, API_KEY, INTERVAL_MINUTES):
+# Frames older than this are reloaded even if the watermark never moves
+# (forecasts, today's bounds after midnight)
+DATA_MEMO_SECONDS = 600
+
+def load(loader, *args, **kwargs):
     """
-    Stores live weather data for ALL cities in country_city
-    with a per-city time gap control.
+    loader(*args, **kwargs), reused until the data watermark moves, so a
+    timed refresh with no new rows re-renders without querying.
     """
-
-    with engine.begin() as conn:
-
-        now = datetime.now(IST)
-
-        # 🔁 Loop through all countries
-        for country, info in country_city.items():
-
-            country_code = info["code"]   # ✅ country code dict value
-
-            # 🔁 Loop through all cities of that country
-            for city in info["cities"]:
-
-                # 1️⃣ Get last stored time for THIS city
-                last_time = conn.execute(
-                    text("""
-                        SELECT MAX(Dates_times)
-                        FROM weather_history
-                        WHERE country = :c AND city = :ci
-                    """),
-                    {"c": country, "ci": city}
-                ).scalar()
-
-                # 2️⃣ Check INTERVAL_MINUTES gap
-                if last_time is not None:
-                    last_time = pd.to_datetime(last_time).tz_localize(IST)
-                    diff_minutes = (now - last_time).total_seconds() / 60
-
-                    # 🔴 REPLACED: min_gap_minutes → INTERVAL_MINUTES
-                    if diff_minutes < INTERVAL_MINUTES:
-                        continue   # ⛔ Skip this city only
-
-                # 3️⃣ Fetch live weather
-                res = requests.get(
-                    f"https://api.openweathermap.org/data/2.5/weather"
-                    f"?q={city},{country_code}&appid={API_KEY}&units=metric",
-                    timeout=10
-                ).json()
-
-                if "main" not in res:
-                    continue  # Skip invalid response
-
-                # 4️⃣ Store ALL values in a dictionary ✅
-                weather_data = {
-                    "country": country,
-                    "city": city,
-                    "temperature": res["main"]["temp"],
-                    "humidity": res["main"]["humidity"],
-                    "wind": res["wind"]["speed"],
-                    "dt": now
-                }
-
-                # 5️⃣ Insert into DB using dictionary
-                conn.execute(
-                    text("""
-                        INSERT INTO weather_history
-                        (country, city, Temperature, humidity, wind, Dates_times)
-                        VALUES (:country, :city, :temperature, :humidity, :wind, :dt)
-                    """),
-                    weather_data
-                )
-
-def get_past_week(engine, country, city):
-    df = pd.read_sql(
-        text("""
-            SELECT Dates_times, temperature
-            FROM weather_history
-            WHERE country=:country AND city=:city
-            ORDER BY Dates_times DESC
-        """),
-        engine,
-        params={"country": country, "city": city}
-    )
-    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
-    return df.sort_values("Dates_times")
-def get_today_weather(engine, country, city):
-    df = pd.read_sql(
-        text("""
-            SELECT Dates_times, temperature
-            FROM weather_history
-            WHERE country = :country
-              AND city = :city
-              AND DATE(Dates_times) = CURDATE()
-            ORDER BY Dates_times
-        """),
-        engine,
-        params={"country": country, "city": city}
-    )
-
-    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
-    return df
-
-def filter_by_time(df, time_col, time_option):
-    if time_option == "Night":
-        return df[df[time_col].dt.hour.between(0, 5)]
-    elif time_option == "Morning":
-        return df[df[time_col].dt.hour.between(6, 11)]
-    elif time_option == "Afternoon":
-        return df[df[time_col].dt.hour.between(12, 17)]
-    elif time_option == "Evening":
-        return df[df[time_col].dt.hour.between(18, 23)]
-    else:
-        return df.copy()
-
-def get_past_daily_avg(engine, country, city, days=5):
-    df = pd.read_sql(
-        text("""
-            SELECT 
-                DATE(Dates_times) AS day,
-                ROUND(AVG(temperature), 1) AS avg_temp
-            FROM weather_history
-            WHERE country = :c
-              AND city = :ci
-              AND DATE(Dates_times) < CURDATE()     -- ❌ exclude today
-            GROUP BY DATE(Dates_times)
-            ORDER BY day DESC
-            LIMIT :d
-        """),
-        engine,
-        params={"c": country, "ci": city, "d": days}
-    )
-
-    # Reverse so it shows Thu → Mon (left to right)
-    return df
-
-
-def get_future_daily_avg(forecast_df, days=5):
-    today = datetime.now().date()
-
-    forecast_df["day"] = forecast_df["Date & Time"].dt.date
-
-    daily_avg = (
-        forecast_df[forecast_df["day"] > today]   # ❌ exclude today
-        .groupby("day")["Temperature (°C)"]
-        .mean()
-        .round(1)
-        .reset_index(name="avg_temp")
-        .sort_values("day")
-        .head(days)
-        .reset_index(drop=True)
+    memo = st.session_state.setdefault("data_memo", {})
+    watermark = st.session_state.get("watermark")
+    if (memo.get("watermark") != watermark
+            or time.monotonic() - memo.get("loaded_at", 0) > DATA_MEMO_SECONDS):
+        memo.clear()
+        memo.update(watermark=watermark, loaded_at=time.monotonic())
+
+    key = (
+        loader.__name__,
+        *(tuple(a) if isinstance(a, list) else a for a in args),
+        *sorted(kwargs.items())
     )
+    if key not in memo:
+        memo[key] = loader(*args, **kwargs)
+    return memo[key]
 
-    return daily_avg
-
+def filter_by_time(df, time_option):
+    # Forecast only: history loaders filter in SQL (part=DAY_PARTS[...])
+    part = DAY_PARTS[time_option]
+    if part is None:
+        return df
+    return df[df["day_part"] == part]
 
 def get_weather_icon(temp):
     if temp >= 35:
@@ -426,6 +184,9 @@ def get_weather_icon(temp):
         return "☁️"
 def render_weather_cards(df, title):
     st.subheader(title)
+    if df.empty:
+        st.warning("⚠️ No data available yet, try again shortly.")
+        return
 
     cols = st.columns(len(df))
 
@@ -460,10 +221,10 @@ def get_delta(current, previous):
     arrow = "↑" if diff > 0 else "↓" if diff < 0 else "→"
     return f"{arrow} {abs(diff)}"
 
-def city_status(today_df):
-    if len(today_df) < 3:
+def city_status(today_stats):
+    if today_stats is None or today_stats["n"] < 3:
         return "🟢 Stable"
-    diff = today_df["temperature"].max() - today_df["temperature"].min()
+    diff = today_stats["temp_max"] - today_stats["temp_min"]
     if diff < 1.5:
         return "🟢 Stable"
     elif diff < 4:
@@ -472,451 +233,253 @@ def city_status(today_df):
         return "🔴 Volatile"
 
 # ---------------------------------
-# MAIN LOGIC
+# MAIN LOGIC (shared by every page)
 # ---------------------------------
 country_code = country_city[COUNTRY]["code"]
+watched_cities = [CITY, *compare_cities]
 
-current = get_current_weather(CITY, country_code)
-weak_df = get_forecast(CITY, country_code)
+# View demand: the ingestion scheduler refreshes watched cities first
+record_views(COUNTRY, watched_cities)
+flush_views(engine)
 
+# Data watermark BEFORE loading, so rows landing mid-run trigger a refresh
+st.session_state["watermark"] = get_watermark(engine, COUNTRY, watched_cities)
 
-set_bg_by_temp(current["temperature"],current["condition"])
+current = get_current_weather(CITY, country_code)
 
-insert_sample_past_data(engine, COUNTRY, CITY)
-store_live_weather_all_cities(engine, country_city, API_KEY, INTERVAL_MINUTES)
+set_bg_by_temp(current["temperature"],current["condition"])
 
-past_df = get_past_week(engine, COUNTRY, CITY)
 
-today_df = get_today_weather(engine, COUNTRY, CITY)
+# =================================================
+# 🏠 HOME PAGE
+# =================================================
+# Each page is a function: st.navigation runs only the selected one, so
+# a page loads only the data it shows and charts render only on Graph.
+def home_page():
+    today_df = load(get_today_weather, engine, COUNTRY, CITY)
+    today_stats = load(get_today_stats, engine, COUNTRY, CITY)
+    past_daily_df = load(get_past_daily_avg, engine, COUNTRY, CITY, days=5)
+    future_daily_df = load(get_future_daily_avg, engine, COUNTRY, CITY, country_code)
+
+    st.title("🌦️ Weather Analytics Dashboard")
+    st.divider()
+    prev_temp = today_df["temperature"].iloc[-2] if len(today_df) > 1 else None
+    delta = get_delta(current["temperature"], prev_temp)
+    status = city_status(today_stats)
+
+    col1, col2, col3, col4,col5 = st.columns(5)
+    col1.metric("🌡️ Temperature (°C)", current["temperature"],delta)
+    col2.metric("💧 Humidity (%)", current["humidity"],delta)
+    col3.metric("🌬️ Wind Speed (m/s)", current["wind"],delta)
+    col4.metric("☁️ Condition", current["condition"].title())
+    col5.metric("City Status:", status)
+
+    last_ts = today_df["Dates_times"].max()
+    if pd.isna(last_ts):
+        last_updated = "— (waiting for ingestion service)"
+    else:
+        last_updated = last_ts.tz_localize(None).strftime('%A, %d-%m-%Y %H:%M:%S')
 
 
-# -------------------------------
-# GET DATA
-# -------------------------------
-past_daily_df = get_past_daily_avg(engine, COUNTRY, CITY, days=5)
-future_daily_df = get_future_daily_avg(weak_df)
-past_filtered_df   = filter_by_time(past_df,  "Dates_times", TIME_OPTION)
-today_filtered_df  = filter_by_time(today_df, "Dates_times", TIME_OPTION)
-future_filtered_df = filter_by_time(weak_df,  "Date & Time", TIME_OPTION)
-# ---------------------------------
-# UI
-# ---------------------------------
-st.markdown('<div id="home" class="page default">', unsafe_allow_html=True)
-st.title("🌦️ Weather Analytics Dashboard")
-st.divider()
-prev_temp = today_df["temperature"].iloc[-2] if len(today_df) > 1 else None
-delta = get_delta(current["temperature"], prev_temp)
-status = city_status(today_df)
-
-col1, col2, col3, col4,col5 = st.columns(5)
-col1.metric("🌡️ Temperature (°C)", current["temperature"],delta)
-col2.metric("💧 Humidity (%)", current["humidity"],delta)
-col3.metric("🌬️ Wind Speed (m/s)", current["wind"],delta)
-col4.metric("☁️ Condition", current["condition"].title())
-col5.metric("City Status:", status)
-
-last_ts = today_df["Dates_times"].max()
-last_ts = last_ts.tz_localize(None)
-
-
-st.markdown(
-    f"**Last Updated:** {last_ts.strftime('%A, %d-%m-%Y %H:%M:%S')} | Location: **{CITY}, {COUNTRY}**"
-)
+    st.markdown(
+        f"**Last Updated:** {last_updated} | Location: **{CITY}, {COUNTRY}**"
+    )
 
 
-st.divider()
-render_weather_cards(past_daily_df, "🕒 Past Days Average")
+    st.divider()
+    render_weather_cards(past_daily_df, "🕒 Past Days Average")
 
-st.divider()
-render_weather_cards(future_daily_df.head(5), "🔮 Future Days Average")
+    st.divider()
+    render_weather_cards(future_daily_df.head(5), "🔮 Future Days Average")
 
-st.divider()
-st.subheader("📈 Today Temperature Statistics (Database)")
+    st.divider()
+    st.subheader("📈 Today Temperature Statistics (Database)")
 
-if not today_df.empty:
-    temps = today_df["temperature"].to_numpy(float)
-    st.write(f"Max: {temps.max():.2f} °C")
-    st.write(f"Min: {temps.min():.2f} °C")
-    st.write(f"Avg: {temps.mean():.2f} °C")
-st.markdown('</div>', unsafe_allow_html=True)
+    if today_stats is not None:
+        st.write(f"Max: {today_stats['temp_max']:.2f} °C")
+        st.write(f"Min: {today_stats['temp_min']:.2f} °C")
+        st.write(f"Avg: {today_stats['temp_avg']:.2f} °C")
 
 # =================================================
 # 📊 DATA PAGE
 # =================================================
-st.markdown('<div id="data" class="page">', unsafe_allow_html=True)
-st.title("📊 Weather Data")
-
-st.subheader("📊 Past Weather")
-st.dataframe(
-    past_filtered_df
-        .rename(columns={"temperature": "Temperature(°C)"}),
-    use_container_width=True)
+def data_page():
+    part = DAY_PARTS[TIME_OPTION]
+    past_filtered_df   = load(get_past_week, engine, COUNTRY, CITY, part=part)
+    today_filtered_df  = load(get_today_weather, engine, COUNTRY, CITY, part=part)
+    future_filtered_df = filter_by_time(load(get_forecast, engine, COUNTRY, CITY, country_code), TIME_OPTION)
 
+    st.title("📊 Weather Data")
 
+    st.subheader("📊 Past Weather")
+    st.dataframe(
+        past_filtered_df
+            .rename(columns={"temperature": "Temperature(°C)"}),
+        use_container_width=True)
 
-st.subheader("📊 Today Live Weather")
-st.dataframe(
-    today_filtered_df
-        .rename(columns={"temperature": "Temperature(°C)"}),
-    use_container_width=True)
 
 
-st.subheader("📊 Future Weather")
-st.dataframe(
-    future_filtered_df[["Date & Time", "Temperature (°C)"]],
-    use_container_width=True)
+    st.subheader("📊 Today Live Weather")
+    st.dataframe(
+        today_filtered_df
+            .rename(columns={"temperature": "Temperature(°C)"}),
+        use_container_width=True)
 
 
-st.markdown('</div>', unsafe_allow_html=True)
+    st.subheader("📊 Future Weather")
+    st.dataframe(
+        future_filtered_df[["Date & Time", "Temperature (°C)"]],
+        use_container_width=True)
 
 # =================================================
 # 📈 GRAPH PAGE
 # =================================================
-st.markdown('<div id="graph" class="page">', unsafe_allow_html=True)
-
-st.title("📈 Weather Trends")
-
-st.subheader("📉  PAST Temperature Trend (Selected Time Range)")
-
-# Safety check (VERY IMPORTANT)
-if past_filtered_df.empty:
-    st.warning("⚠️ No data available for the selected time range.")
-else:
-    plt.style.use("seaborn-v0_8")
-
-    fig, ax = plt.subplots(figsize=(12, 5))
-
-    # Line plot
-    ax.plot(
-        past_filtered_df["Dates_times"],
-        past_filtered_df["temperature"],
-        color="#FF00AE",
-        linewidth=3,
-        marker="o",
-        markersize=7,
-        markerfacecolor="white",
-        markeredgecolor="#9500FF"
-    )
+def graph_page():
+    # Selected city + comparison cities in one query
+    today_by_city = load(get_today_weather_many, engine, COUNTRY, watched_cities)
+    today_df = today_by_city[CITY]
+    past_filtered_df   = load(get_past_week, engine, COUNTRY, CITY, part=DAY_PARTS[TIME_OPTION])
+    future_filtered_df = filter_by_time(load(get_forecast, engine, COUNTRY, CITY, country_code), TIME_OPTION)
 
-    # Fill area under curve
-    ax.fill_between(
-        past_filtered_df["Dates_times"],
-        past_filtered_df["temperature"],
-        color="#9900FF44",
-        alpha=0.25
-    )
-
-    # Highlight max temperature
-    max_temp = past_filtered_df["temperature"].max()
-    max_points = past_filtered_df[
-        past_filtered_df["temperature"] == max_temp
-    ]
-
-    ax.scatter(
-        max_points["Dates_times"],
-        max_points["temperature"],
-        color="red",
-        s=100,
-        label="Max Temp"
-    )
-
-    # Highlight min temperature
-    min_temp = past_filtered_df["temperature"].min()
-    min_points = past_filtered_df[
-        past_filtered_df["temperature"] == min_temp
-    ]
-
-    ax.scatter(
-        min_points["Dates_times"],
-        min_points["temperature"],
-        color="blue",
-        s=100,
-        label="Min Temp"
-    )
-
-    # Titles & labels
-    ax.set_title(
-        f"Temperature Trend - {CITY}, {COUNTRY}",
-        fontsize=15,
-        fontweight="bold"
-    )
-    ax.set_xlabel("Date", fontsize=11)
-    ax.set_ylabel("Temperature (°C)", fontsize=11)
-
-    # Grid & background
-    ax.grid(True, linestyle="--", alpha=0.6)
-    ax.set_facecolor("#f9f9f9")
-    fig.patch.set_facecolor("white")
-
-    # Legend
-    ax.legend()
-
-    # X-axis formatting
-    ax.xaxis.set_major_locator(plt.MaxNLocator(7))
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-
-    st.pyplot(fig)
-
-# ---------------------------------
-# TODAY TEMPERATURE TREND GRAPH
-# ---------------------------------
-st.subheader("📊 Today Temperature Trend (Live Data)")
-
-if today_df.empty:
-    st.warning("⚠️ No weather data recorded today yet.")
-else:
-    plt.style.use("seaborn-v0_8")
-
-    fig, ax = plt.subplots(figsize=(12, 5))
-
-    # Line plot
-    ax.plot(
-        today_df["Dates_times"],
-        today_df["temperature"],
-        color="#FF6F00",
-        linewidth=3,
-        marker="o",
-        markersize=6,
-        markerfacecolor="white",
-        markeredgecolor="#FF6F00",
-        label="Temperature"
-    )
-
-    # Fill area
-    ax.fill_between(
-        today_df["Dates_times"],
-        today_df["temperature"],
-        color="#FF6F0044",
-        alpha=0.3
-    )
-
-    # Max & Min
-    max_temp = today_df["temperature"].max()
-    min_temp = today_df["temperature"].min()
-
-    max_points = today_df[today_df["temperature"] == max_temp]
-    min_points = today_df[today_df["temperature"] == min_temp]
-
-    ax.scatter(
-        max_points["Dates_times"],
-        max_points["temperature"],
-        color="red",
-        s=120,
-        label="Max Temp"
-    )
-
-    ax.scatter(
-        min_points["Dates_times"],
-        min_points["temperature"],
-        color="blue",
-        s=120,
-        label="Min Temp"
-    )
-
-    # Titles & labels
-    ax.set_title(
-        f"Today's Temperature Trend - {CITY}, {COUNTRY}",
-        fontsize=15,
-        fontweight="bold"
-    )
-    ax.set_xlabel("Time", fontsize=11)
-    ax.set_ylabel("Temperature (°C)", fontsize=11)
-
-    # Grid & background
-    ax.grid(True, linestyle="--", alpha=0.6)
-    ax.set_facecolor("#f9f9f9")
-    fig.patch.set_facecolor("white")
-
-    # X-axis formatting
-    ax.xaxis.set_major_locator(plt.MaxNLocator(8))
-    plt.xticks(rotation=45, ha="right")
-
-    # Legend
-    ax.legend()
-
-    plt.tight_layout()
-    st.pyplot(fig)
-
-# -------------------------------
-# FUTURE FORECAST GRAPH
-# -------------------------------
-st.subheader("📈 Future Forecast (Advanced View)")
+    st.title("📈 Weather Trends")
 
-plt.style.use("seaborn-v0_8-darkgrid")
+    st.subheader("📉  PAST Temperature Trend (Selected Time Range)")
 
-fig2, ax2 = plt.subplots(figsize=(12, 5))
-
-x = future_filtered_df["Date & Time"]
-y = future_filtered_df["Temperature (°C)"]
-
-
-# 🔥 Main temperature line
-ax2.plot(
-    x,
-    y,
-    color="#FF7A00",
-    linewidth=3,
-    marker="o",
-    markersize=6,
-    markerfacecolor="white",
-    markeredgewidth=2,
-    markeredgecolor="#FF7A00",
-    label="Forecast Temp"
-)
-
-# 🌈 Glow effect (draw multiple transparent lines)
-for lw in range(6, 1, -1):
-    ax2.plot(x, y, color="#FF7A00", linewidth=lw, alpha=0.08)
-    # 1️⃣ Main forecast line
-    ax2.plot(
-        x, y,
-        color="#FF7A00",
-        linewidth=3,
-        marker="o",
-        markersize=6,
-        markerfacecolor="white",
-        markeredgewidth=2,
-        markeredgecolor="#FF7A00",
-        label="Forecast Temp"
-    )
-
-    # 2️⃣ Glow effect (visual only, no legend)
-    for lw in range(6, 1, -1):
-        ax2.plot(x, y, color="#FF7A00", linewidth=lw, alpha=0.08)
-
-    # 3️⃣ Expected range (ADD ONLY ONCE ✅)
-    ax2.fill_between(
-        x,
-        y - 1.5,
-        y + 1.5,
-        color="#4ADE80",
-        alpha=0.25,
-        label="Expected Range"
-    )
-
-    # 4️⃣ Optional: Base fill under curve
-    ax2.fill_between(
-        x,
-        y,
-        min(y) - 2,
-        color="#FF7A00",
-        alpha=0.12
-    )
-
-# 🌊 Gradient fill under curve
-ax2.fill_between(
-    x,
-    y,
-    min(y) - 2,
-    color="#FF7A00",
-    alpha=0.18
-)
-
-# 🔴 Max temperature annotation
-max_temp = y.max()
-max_time = x[y.idxmax()]
-ax2.scatter(max_time, max_temp, color="red", s=120, zorder=5)
-ax2.annotate(
-    f"Max {max_temp:.1f}°C",
-    (max_time, max_temp),
-    xytext=(0, 12),
-    textcoords="offset points",
-    ha="center",
-    fontsize=10,
-    fontweight="bold",
-    color="red"
-)
-
-# 🔵 Min temperature annotation
-min_temp = y.min()
-min_time = x[y.idxmin()]
-ax2.scatter(min_time, min_temp, color="blue", s=120, zorder=5)
-ax2.annotate(
-    f"Min {min_temp:.1f}°C",
-    (min_time, min_temp),
-    xytext=(0, -18),
-    textcoords="offset points",
-    ha="center",
-    fontsize=10,
-    fontweight="bold",
-    color="blue"
-)
-
-# 🧭 Titles & labels
-ax2.set_title(
-    f"Future Temperature Forecast – {CITY}, {COUNTRY}",
-    fontsize=16,
-    fontweight="bold",
-    pad=12
-)
-ax2.set_xlabel("Date & Time", fontsize=11)
-ax2.set_ylabel("Temperature (°C)", fontsize=11)
-
-# 🧱 Styling
-ax2.set_facecolor("#0E1117")
-fig2.patch.set_facecolor("#0E1117")
-ax2.tick_params(colors="white")
-ax2.xaxis.label.set_color("white")
-ax2.yaxis.label.set_color("white")
-ax2.title.set_color("white")
-
-# ⏱ X-axis formatting
-ax2.xaxis.set_major_locator(plt.MaxNLocator(8))
-plt.xticks(rotation=45, ha="right")
-
-# 📌 Legend
-ax2.legend(facecolor="#1f2933", edgecolor="white", labelcolor="white")
-
-# 5️⃣ Max / Min points
-ax2.scatter(x[y.idxmax()], y.max(), color="red", s=120, zorder=5, label="Max")
-ax2.scatter(x[y.idxmin()], y.min(), color="blue", s=120, zorder=5, label="Min")
-
-# 6️⃣ Legend (ONCE, at the end)
-plt.tight_layout()
-st.pyplot(fig2)
-
-# comparision
-st.subheader("📊 City-wise Temperature Comparison (Today)")
-
-fig, ax = plt.subplots(figsize=(12, 5))
-
-# Main city
-ax.plot(
-    today_df["Dates_times"],
-    today_df["temperature"],
-    color="#FF6F00",
-    linewidth=3,
-    marker="o",
-    label=CITY
-)
-
-
-# Comparison city
+    # Safety check (VERY IMPORTANT)
+    if past_filtered_df.empty:
+        st.warning("⚠️ No data available for the selected time range.")
+    else:
+        st.image(render_chart({
+            "style": "seaborn-v0_8",
+            "title": f"Temperature Trend - {CITY}, {COUNTRY}",
+            "xlabel": "Date",
+            "ylabel": "Temperature (°C)",
+            "max_ticks": 7,
+            "series": [{
+                "data": past_filtered_df[["Dates_times", "temperature"]],
+                "x": "Dates_times", "y": "temperature",
+                "color": "#FF00AE", "linewidth": 3,
+                "marker": "o", "markersize": 7,
+                "markerfacecolor": "white", "markeredgecolor": "#9500FF",
+                "fill": {"color": "#9900FF44", "alpha": 0.25},
+            }],
+            "extrema": {"size": 100},
+        }), use_container_width=True)
+
+    # ---------------------------------
+    # TODAY TEMPERATURE TREND GRAPH
+    # ---------------------------------
+    st.subheader("📊 Today Temperature Trend (Live Data)")
+
+    if today_df.empty:
+        st.warning("⚠️ No weather data recorded today yet.")
+    else:
+        st.image(render_chart({
+            "style": "seaborn-v0_8",
+            "title": f"Today's Temperature Trend - {CITY}, {COUNTRY}",
+            "xlabel": "Time",
+            "ylabel": "Temperature (°C)",
+            "max_ticks": 8,
+            "series": [{
+                "data": today_df[["Dates_times", "temperature"]],
+                "x": "Dates_times", "y": "temperature",
+                "color": "#FF6F00", "linewidth": 3,
+                "marker": "o", "markersize": 6,
+                "markerfacecolor": "white", "markeredgecolor": "#FF6F00",
+                "label": "Temperature",
+                "fill": {"color": "#FF6F0044", "alpha": 0.3},
+            }],
+            "extrema": {"size": 120},
+        }), use_container_width=True)
+
+    # -------------------------------
+    # FUTURE FORECAST GRAPH
+    # -------------------------------
+    st.subheader("📈 Future Forecast (Advanced View)")
+
+    if future_filtered_df.empty:
+        st.warning("⚠️ No forecast data for the selected time range.")
+    else:
+        st.image(render_chart({
+            "style": "seaborn-v0_8-darkgrid",
+            "theme": "dark",
+            "title": f"Future Temperature Forecast – {CITY}, {COUNTRY}",
+            "title_size": 16,
+            "title_pad": 12,
+            "xlabel": "Date & Time",
+            "ylabel": "Temperature (°C)",
+            "grid": False,
+            "max_ticks": 8,
+            "series": [{
+                "data": future_filtered_df[["Date & Time", "Temperature (°C)"]].reset_index(drop=True),
+                "x": "Date & Time", "y": "Temperature (°C)",
+                "color": "#FF7A00", "linewidth": 3,
+                "marker": "o", "markersize": 6,
+                "markerfacecolor": "white", "markeredgewidth": 2,
+                "markeredgecolor": "#FF7A00",
+                "label": "Forecast Temp",
+                "glow": True,
+                "band": {"width": 1.5, "color": "#4ADE80", "alpha": 0.25,
+                         "label": "Expected Range"},
+                "fill": {"color": "#FF7A00", "alpha": 0.18, "below_min": 2},
+            }],
+            "extrema": {"size": 120, "labels": False, "annotate": True},
+        }), use_container_width=True)
+
+    # comparision
+    st.subheader("📊 City-wise Temperature Comparison (Today)")
+
+    # Main city
+    series = [{
+        "data": today_df[["Dates_times", "temperature"]],
+        "x": "Dates_times", "y": "temperature",
+        "color": "#FF6F00", "linewidth": 3, "marker": "o",
+        "label": CITY,
+    }]
+
+    # Comparison city
+
+    colors = ["#3B82F6", "#22C55E", "#EF4444", "#A855F7", "#14B8A6"]
+
+    for i, city in enumerate(compare_cities):
+        compare_df = today_by_city[city]
+
+        if not compare_df.empty:
+            series.append({
+                "data": compare_df[["Dates_times", "temperature"]],
+                "x": "Dates_times", "y": "temperature",
+                "linestyle": "--", "linewidth": 2, "marker": "o",
+                "color": colors[i % len(colors)],
+                "label": city,
+            })
+
+    st.image(render_chart({
+        "style": "seaborn-v0_8-darkgrid",
+        "grid": False,
+        "series": series,
+    }), use_container_width=True)
 
-colors = ["#3B82F6", "#22C55E", "#EF4444", "#A855F7", "#14B8A6"]
+# -------------------------------------------------
+# 🧭 PAGE ROUTING (top navigation bar)
+# -------------------------------------------------
+# Page opened at "/" (benchmark.py times each one this way)
+DEFAULT_PAGE = os.getenv("DASHBOARD_DEFAULT_PAGE", "home")
 
-for i, city in enumerate(compare_cities):
-    compare_df = get_today_weather(engine, COUNTRY, city)
+page = st.navigation([
+    st.Page(home_page, title="Home", icon="🏠", url_path="home",
+            default=DEFAULT_PAGE == "home"),
+    st.Page(data_page, title="Data View", icon="📊", url_path="data",
+            default=DEFAULT_PAGE == "data"),
+    st.Page(graph_page, title="Graph View", icon="📈", url_path="graph",
+            default=DEFAULT_PAGE == "graph"),
+], position="top")
 
-    if not compare_df.empty:
-        ax.plot(
-            compare_df["Dates_times"],
-            compare_df["temperature"],
-            linestyle="--",
-            linewidth=2,
-            marker="o",
-            color=colors[i % len(colors)],
-            label=city
-        )
+page.run()
 
-ax.legend()
-st.pyplot(fig)
-st.markdown('</div>', unsafe_allow_html=True)
 with st.expander("ℹ️ How this dashboard works"):
     st.markdown("""
     - Weather data fetched from **OpenWeatherMap API**
-    - Stored every **INTERVAL_MINUTES**
+    - Stored every **INTERVAL_MINUTES** by the background ingestion service
     - All cities tracked independently
     - Averages computed from database (not API)
     - Timezone handled using IST
@@ -999,9 +562,33 @@ components.html(
 height=100,
 )
 
+# -------------------------------------------------
+# ⏱️ DEBUG: STAGE TIMINGS
+# -------------------------------------------------
+metrics.observe("page_run", time.perf_counter() - page_started, page=page.title)
+
+if DEBUG_METRICS or st.query_params.get("debug") == "1":
+    with st.sidebar.expander("⏱️ Stage timings", expanded=True):
+        st.dataframe(pd.DataFrame(metrics.summary()), hide_index=True)
+
 # -------------------------------------------------
 # AUTO REFRESH
 # -------------------------------------------------
-if REFRESH_INTERVAL > 0:
-    time.sleep(REFRESH_INTERVAL)
-    st.rerun()
+# The browser re-runs only this fragment every REFRESH_INTERVAL, so no
+# server thread sleeps between cycles. It polls the data watermark and
+# the cached current weather, and reruns the app only when either moved:
+# the metrics and background are redrawn, and load() re-queries only
+# when the watermark changed.
+@st.fragment(run_every=REFRESH_INTERVAL if REFRESH_INTERVAL > 0 else None)
+def auto_refresh():
+    watermark = get_watermark(engine, COUNTRY, watched_cities)
+    shown = st.session_state.get("current_res")
+    try:
+        latest = get_current_weather_json(CITY, country_code, API_KEY, wait=API_TOKEN_WAIT_SECONDS)
+    except ApiError:     # keep showing the last reading
+        latest = shown
+
+    if watermark != st.session_state.get("watermark") or latest is not shown:
+        st.rerun()
+
+auto_refresh()
@@ -0,0 +1,277 @@
+"""
+Optional local Parquet mirror of weather_history.
+
+Rows are stored as country=<c>/city=<c>/day=<YYYY-MM-DD>/part-<id>.parquet
+and synced incrementally by a background thread (start_sync): each sync
+pulls only rows with an id above the watermark saved in _watermark.json,
+so the mirror survives restarts and a page load reads history without
+touching the DB. Ids can commit out of order
+(ingestion transactions stay open across fetches, several workers insert
+at once), so each sync also re-reads the last SYNC_OVERLAP_MINUTES below
+the watermark and adds the ids the mirror is missing.
+
+Enable it by setting HISTORY_CACHE_DIR (requires pyarrow).
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import pandas as pd
+from sqlalchemy import text
+
+from weather_ingest import IST
+
+# pyarrow modules, imported by enabled() on first use: pyarrow.dataset
+# alone costs ~0.5 s, which cold starts without a cache should not pay
+pa = pc = ds = pq = fs = None
+_arrow_missing = False
+
+
+HISTORY_CACHE_DIR = os.getenv("HISTORY_CACHE_DIR")
+
+# Seconds between two incremental syncs of the background thread
+SYNC_MIN_INTERVAL = int(os.getenv("HISTORY_SYNC_SECONDS", "60"))
+SYNC_BATCH_ROWS = int(os.getenv("HISTORY_SYNC_BATCH_ROWS", "50000"))
+
+# Late-commit window re-read on every sync; must exceed the longest
+# ingestion transaction
+SYNC_OVERLAP_MINUTES = int(os.getenv("HISTORY_SYNC_OVERLAP_MINUTES", "30"))
+
+# Parquet files per day partition before they are merged into one
+COMPACT_AFTER_FILES = 16
+
+# Local days kept (matches weather_history retention by default)
+KEEP_DAYS = int(os.getenv("WEATHER_HISTORY_RETENTION_DAYS", "30"))
+
+COLUMNS = ["id", "Dates_times", "temperature", "humidity", "wind"]
+
+SYNC_SQL = text("""
+    SELECT id, country, city, Dates_times, temperature AS temperature, humidity, wind
+    FROM weather_history
+    WHERE id > :wm
+    ORDER BY id
+    LIMIT :n
+""")
+
+LATE_ROWS_SQL = text("""
+    SELECT id, country, city, Dates_times, temperature AS temperature, humidity, wind
+    FROM weather_history
+    WHERE Dates_times >= :since AND id <= :wm
+""")
+
+_lock = threading.Lock()
+_sync_thread = None
+_start_lock = threading.Lock()
+
+
+def _import_arrow():
+    global pa, pc, ds, pq, fs, _arrow_missing
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+        from pyarrow import fs as pyarrow_fs
+    except ImportError:     # optional dependency
+        _arrow_missing = True
+        return False
+
+    pa, pc, ds, pq, fs = (
+        pyarrow, pyarrow.compute, pyarrow.dataset, pyarrow.parquet, pyarrow_fs
+    )
+    return True
+
+def enabled():
+    if not HISTORY_CACHE_DIR or _arrow_missing:
+        return False
+    return pa is not None or _import_arrow()
+
+def _watermark_path():
+    return os.path.join(HISTORY_CACHE_DIR, "_watermark.json")
+
+def ready():
+    """True once a sync has stored rows (before that, read the DB)."""
+    return read_watermark() > 0
+
+def read_watermark():
+    try:
+        with open(_watermark_path()) as f:
+            return int(json.load(f)["last_id"])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+def _write_watermark(last_id):
+    tmp = _watermark_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_id": int(last_id)}, f)
+    os.replace(tmp, _watermark_path())   # atomic on the same filesystem
+
+
+# -------------------------------------------------
+# WRITE SIDE (incremental sync)
+# -------------------------------------------------
+def _partition_dir(country, city, day):
+    return os.path.join(
+        HISTORY_CACHE_DIR,
+        f"country={quote(country, safe='')}",
+        f"city={quote(city, safe='')}",
+        f"day={day}"
+    )
+
+def _compact(path):
+    files = sorted(f for f in os.listdir(path) if f.endswith(".parquet"))
+    if len(files) <= COMPACT_AFTER_FILES:
+        return
+
+    table = pa.concat_tables(pq.read_table(os.path.join(path, f)) for f in files)
+    last = int(pc.max(table["id"]).as_py())
+    # "_" prefix: dataset discovery skips it, so readers never count the
+    # merged rows twice while the originals still exist
+    tmp = os.path.join(path, f"_part-{last}.parquet.tmp")
+    pq.write_table(table, tmp)
+    for f in files:
+        os.remove(os.path.join(path, f))
+    os.replace(tmp, os.path.join(path, f"part-{last}.parquet"))
+
+def _append(df):
+    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
+    df["day"] = df["Dates_times"].dt.strftime("%Y-%m-%d")
+
+    for (country, city, day), part in df.groupby(["country", "city", "day"]):
+        path = _partition_dir(country, city, day)
+        os.makedirs(path, exist_ok=True)
+        table = pa.Table.from_pandas(part[COLUMNS], preserve_index=False)
+        pq.write_table(table, os.path.join(path, f"part-{int(part['id'].max())}.parquet"))
+        _compact(path)
+
+def _prune(today):
+    cutoff = (today - timedelta(days=KEEP_DAYS)).isoformat()
+    for root, dirs, _ in os.walk(HISTORY_CACHE_DIR):
+        for d in list(dirs):
+            if d.startswith("day=") and d[4:] < cutoff:
+                path = os.path.join(root, d)
+                for f in os.listdir(path):
+                    os.remove(os.path.join(path, f))
+                os.rmdir(path)
+                dirs.remove(d)
+
+def _mirrored_ids(since):
+    try:
+        table = _dataset().to_table(
+            columns=["id"], filter=ds.field("day") >= since.strftime("%Y-%m-%d")
+        )
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return set()
+    return set(table["id"].to_pylist())
+
+def _sync_late_rows(engine, wm):
+    """Rows at or below the watermark that committed after it was taken."""
+    since = datetime.now(IST).replace(tzinfo=None) - timedelta(minutes=SYNC_OVERLAP_MINUTES)
+    df = pd.read_sql(LATE_ROWS_SQL, engine, params={"since": since, "wm": wm})
+    if df.empty:
+        return 0
+
+    df = df[~df["id"].isin(_mirrored_ids(since))]
+    if not df.empty:
+        _append(df.copy())
+    return len(df)
+
+def sync(engine):
+    """
+    Pulls every weather_history row newer than the stored watermark,
+    plus late commits inside the overlap window.
+    Returns the number of rows added.
+    """
+    added = 0
+
+    with _lock:
+        os.makedirs(HISTORY_CACHE_DIR, exist_ok=True)
+        wm = read_watermark()
+        if wm:
+            added += _sync_late_rows(engine, wm)
+
+        while True:
+            df = pd.read_sql(SYNC_SQL, engine, params={"wm": wm, "n": SYNC_BATCH_ROWS})
+            if df.empty:
+                break
+
+            _append(df)
+            wm = int(df["id"].max())
+            _write_watermark(wm)
+            added += len(df)
+
+            if len(df) < SYNC_BATCH_ROWS:
+                break
+
+        _prune(datetime.now(IST).date())
+
+    return added
+
+def start_sync(engine, every=SYNC_MIN_INTERVAL):
+    """
+    Keeps the mirror current from a daemon thread (once per process), so
+    no page render ever waits on a sync, not even the first big one.
+    """
+    global _sync_thread
+    with _start_lock:
+        if _sync_thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    sync(engine)
+                except Exception as e:
+                    print(f"History mirror sync failed: {e}")
+                time.sleep(every)
+
+        _sync_thread = threading.Thread(target=loop, daemon=True)
+        _sync_thread.start()
+
+
+# -------------------------------------------------
+# READ SIDE (memory-mapped, column-pruned scans)
+# -------------------------------------------------
+_PARTITIONING = None
+
+def _dataset():
+    global _PARTITIONING
+    if _PARTITIONING is None:
+        _PARTITIONING = ds.partitioning(
+            pa.schema([("country", pa.string()), ("city", pa.string()), ("day", pa.string())]),
+            flavor="hive"
+        )
+    return ds.dataset(
+        HISTORY_CACHE_DIR,
+        format="parquet",
+        partitioning=_PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+
+def _empty_frame(columns):
+    """No rows yet, but the dtypes callers rely on (.dt, arithmetic)."""
+    dtypes = {"id": "int64", "Dates_times": "datetime64[ns]", "country": "object", "city": "object"}
+    return pd.DataFrame({c: pd.Series(dtype=dtypes.get(c, "float64")) for c in columns})
+
+def read_history(country, cities, start=None, end=None,
+                 columns=("Dates_times", "temperature")):
+    """
+    Rows for `cities` with start <= Dates_times < end (naive IST),
+    reading only the requested columns and day partitions.
+    """
+    expr = (ds.field("country") == country) & ds.field("city").isin(list(cities))
+    if start is not None:
+        expr &= ds.field("day") >= start.strftime("%Y-%m-%d")
+        expr &= ds.field("Dates_times") >= pa.scalar(pd.Timestamp(start), pa.timestamp("ns"))
+    if end is not None:
+        expr &= ds.field("day") <= end.strftime("%Y-%m-%d")
+        expr &= ds.field("Dates_times") < pa.scalar(pd.Timestamp(end), pa.timestamp("ns"))
+
+    try:
+        table = _dataset().to_table(columns=list(columns), filter=expr)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return _empty_frame(columns)
+
+    return table.to_pandas().sort_values("Dates_times").reset_index(drop=True)
@@ -0,0 +1,117 @@
+"""
+Staged ingestion pipeline: fetch → parse/validate → batch write.
+
+Each stage runs on its own worker threads and hands work to the next one
+through a bounded queue, so network fetches and DB writes overlap while
+memory stays flat: when the writer falls behind, the queues fill up and
+the fetchers simply block.
+
+    run_pipeline(items, fetch, parse, writer)
+
+    fetch(item)        → raw response (network; fetch_workers threads)
+    parse(item, raw)   → iterable of rows (validation; parse_workers threads)
+    writer.add(row)    → BatchWriter; called from ONE thread only
+"""
+import os
+import queue
+import threading
+
+from weather_ingest import FETCH_CONCURRENCY
+
+
+PARSE_WORKERS = int(os.getenv("PIPELINE_PARSE_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+
+_DONE = object()
+
+
+def _stage(source, sink, workers, work, on_error):
+    """Starts `workers` threads moving items from source to sink."""
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def loop():
+        while True:
+            item = source.get()
+            if item is _DONE:
+                break
+            try:
+                for out in work(item):
+                    sink.put(out)
+            except Exception as e:
+                on_error(item, e)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            sink.put(_DONE)
+        else:
+            source.put(_DONE)    # let the next worker of this stage stop too
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+def run_pipeline(items, fetch, parse, writer,
+                 fetch_workers=FETCH_CONCURRENCY, parse_workers=PARSE_WORKERS,
+                 queue_size=QUEUE_SIZE):
+    """
+    Streams `items` through the three stages and flushes the writer.
+    Returns {"fetched", "rows", "errors"} counts.
+    """
+    stats = {"fetched": 0, "rows": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def bump(key):
+        with stats_lock:
+            stats[key] += 1
+
+    def on_error(item, e):
+        bump("errors")
+        print(f"Error for {item}: {e}")
+
+    to_fetch = queue.Queue(maxsize=queue_size)
+    to_parse = queue.Queue(maxsize=queue_size)
+    to_write = queue.Queue(maxsize=queue_size)
+
+    def do_fetch(item):
+        raw = fetch(item)
+        bump("fetched")
+        yield (item, raw)
+
+    def do_parse(pair):
+        item, raw = pair
+        try:
+            rows = list(parse(item, raw))
+        except Exception as e:
+            on_error(item, e)
+            return
+        yield from rows
+
+    threads = _stage(to_fetch, to_parse, max(1, fetch_workers), do_fetch, on_error)
+    threads += _stage(to_parse, to_write, max(1, parse_workers), do_parse, on_error)
+
+    def write_loop():
+        while True:
+            row = to_write.get()
+            if row is _DONE:
+                break
+            writer.add(row)
+            stats["rows"] += 1
+        writer.flush()
+
+    write_thread = threading.Thread(target=write_loop, daemon=True)
+    write_thread.start()
+
+    # Feeding blocks whenever the fetch queue is full (backpressure)
+    for item in items:
+        to_fetch.put(item)
+    to_fetch.put(_DONE)
+
+    for t in threads:
+        t.join()
+    write_thread.join()
+
+    return stats
@@ -0,0 +1,298 @@
+"""
+Sharded ingestion with DB-backed leases.
+
+Cities hash (crc32 of "City,CC") onto INGEST_SHARDS fixed shards. Every
+worker heartbeats into ingest_workers and holds a fair share of shards
+in ingest_leases; a lease is only ever taken with a compare-and-set
+UPDATE, so one shard (and therefore one city) has one owner at a time.
+
+  * worker joins → everyone's fair share shrinks, extras are released
+  * worker dies  → its heartbeat and leases expire, survivors claim them
+
+Try it with several local processes against one SQLite file:
+
+    export DATABASE_URL=sqlite:///leases.db
+    python leases.py --worker a &  python leases.py --worker b &
+    python leases.py --status
+"""
+import os
+import sys
+import math
+import time
+import random
+import signal
+import socket
+import zlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
+
+from weather_ingest import country_city, get_engine
+
+
+# Fixed for a deployment: changing it remaps cities to shards
+INGEST_SHARDS = int(os.getenv("INGEST_SHARDS", "0"))    # 0 = unsharded
+
+# A lease (and a worker heartbeat) lives this long without renewal.
+# Must comfortably exceed one ingestion tick.
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "180"))
+
+WORKER_ID = os.getenv("INGEST_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+LEASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS ingest_leases (
+        shard INT PRIMARY KEY,
+        owner VARCHAR(128) NULL,
+        expires_at DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingest_workers (
+        worker_id VARCHAR(128) PRIMARY KEY,
+        heartbeat_at DATETIME NOT NULL
+    )
+    """,
+]
+
+
+def _utcnow():
+    # Naive UTC on every worker (assumes NTP-synced clocks; skew << TTL)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def city_key(city, country_code):
+    return f"{city},{country_code}"
+
+def shard_of(key, shards=INGEST_SHARDS):
+    """Stable across processes and machines (unlike hash())."""
+    return zlib.crc32(key.encode()) % shards
+
+def ensure_tables(engine, shards=INGEST_SHARDS):
+    """Creates the lease tables and one row per shard (idempotent)."""
+    with engine.begin() as conn:
+        for statement in LEASE_SCHEMA:
+            conn.execute(text(statement))
+
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT shard FROM ingest_leases"))}
+
+    for shard in range(shards):
+        if shard in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO ingest_leases (shard, owner, expires_at) VALUES (:s, NULL, NULL)"),
+                    {"s": shard}
+                )
+        except IntegrityError:
+            pass    # another worker inserted it first
+
+
+# -------------------------------------------------
+# LEASES
+# -------------------------------------------------
+class ShardLeases:
+    """
+    This worker's view of the shard map.
+
+    heartbeat() renews, releases and claims leases and returns the
+    shards this worker may ingest until the next heartbeat. Only cities
+    in those shards should be fetched.
+    """
+
+    def __init__(self, engine, worker_id=WORKER_ID, shards=INGEST_SHARDS,
+                 ttl=LEASE_TTL_SECONDS):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.shards = shards
+        self.ttl = timedelta(seconds=ttl)
+        self.owned = set()
+        self.live = 1
+
+    def _beat(self, conn, now):
+        updated = conn.execute(
+            text("UPDATE ingest_workers SET heartbeat_at = :now WHERE worker_id = :me"),
+            {"now": now, "me": self.worker_id}
+        ).rowcount
+        if not updated:
+            conn.execute(
+                text("INSERT INTO ingest_workers (worker_id, heartbeat_at) VALUES (:me, :now)"),
+                {"now": now, "me": self.worker_id}
+            )
+
+        # Forget workers that have been gone for a long time
+        conn.execute(
+            text("DELETE FROM ingest_workers WHERE heartbeat_at < :cutoff"),
+            {"cutoff": now - 10 * self.ttl}
+        )
+        return conn.execute(
+            text("SELECT COUNT(*) FROM ingest_workers WHERE heartbeat_at >= :alive"),
+            {"alive": now - self.ttl}
+        ).scalar()
+
+    def heartbeat(self):
+        """Renews, rebalances and returns the set of shards owned now."""
+        now = _utcnow()
+        expires = now + self.ttl
+
+        with self.engine.begin() as conn:
+            live = self.live = max(1, self._beat(conn, now))
+
+            # Renew only leases that are still valid; an expired one may
+            # already belong to someone else
+            conn.execute(
+                text("""
+                    UPDATE ingest_leases SET expires_at = :exp
+                    WHERE owner = :me AND expires_at >= :now
+                """),
+                {"exp": expires, "me": self.worker_id, "now": now}
+            )
+            mine = sorted(row[0] for row in conn.execute(
+                text("SELECT shard FROM ingest_leases WHERE owner = :me AND expires_at >= :now"),
+                {"me": self.worker_id, "now": now}
+            ))
+
+        target = math.ceil(self.shards / live)
+
+        if len(mine) > target:
+            extra = mine[target:]
+            with self.engine.begin() as conn:
+                conn.execute(
+                    text("""
+                        UPDATE ingest_leases SET owner = NULL, expires_at = NULL
+                        WHERE owner = :me AND shard IN :extra
+                    """).bindparams(bindparam("extra", expanding=True)),
+                    {"me": self.worker_id, "extra": extra}
+                )
+            mine = mine[:target]
+
+        elif len(mine) < target:
+            with self.engine.begin() as conn:
+                free = [row[0] for row in conn.execute(
+                    text("""
+                        SELECT shard FROM ingest_leases
+                        WHERE owner IS NULL OR expires_at < :now
+                    """),
+                    {"now": now}
+                )]
+            random.shuffle(free)    # fewer collisions between claiming workers
+
+            for shard in free[:target - len(mine)]:
+                # Compare-and-set: wins only if the shard is still free
+                with self.engine.begin() as conn:
+                    claimed = conn.execute(
+                        text("""
+                            UPDATE ingest_leases SET owner = :me, expires_at = :exp
+                            WHERE shard = :s AND (owner IS NULL OR expires_at < :now)
+                        """),
+                        {"me": self.worker_id, "exp": expires, "s": shard, "now": now}
+                    ).rowcount
+                if claimed:
+                    mine.append(shard)
+
+        self.owned = set(mine)
+        return self.owned
+
+    def owns(self, key):
+        return shard_of(key, self.shards) in self.owned
+
+    def filter_cities(self, cities):
+        """Keeps the "City,CC" strings this worker owns."""
+        return [c for c in cities if self.owns(c)]
+
+    def filter_registry(self, registry):
+        """country_city-shaped registry restricted to owned cities."""
+        owned = {}
+        for country, info in registry.items():
+            cities = [c for c in info["cities"] if self.owns(city_key(c, info["code"]))]
+            if cities:
+                owned[country] = {**info, "cities": cities}
+        return owned
+
+    def release_all(self):
+        """Graceful shutdown: hand every shard back immediately."""
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE ingest_leases SET owner = NULL, expires_at = NULL WHERE owner = :me"),
+                {"me": self.worker_id}
+            )
+            conn.execute(
+                text("DELETE FROM ingest_workers WHERE worker_id = :me"),
+                {"me": self.worker_id}
+            )
+        self.owned = set()
+
+
+# -------------------------------------------------
+# CLI (local multi-process testing)
+# -------------------------------------------------
+def print_status(engine):
+    now = _utcnow()
+    with engine.begin() as conn:
+        workers = conn.execute(
+            text("SELECT worker_id, heartbeat_at FROM ingest_workers ORDER BY worker_id")
+        ).fetchall()
+        owners = conn.execute(
+            text("""
+                SELECT owner, COUNT(*) FROM ingest_leases
+                WHERE owner IS NOT NULL AND expires_at >= :now
+                GROUP BY owner
+            """),
+            {"now": now}
+        ).fetchall()
+        total = conn.execute(text("SELECT COUNT(*) FROM ingest_leases")).scalar()
+
+    held = dict(owners)
+    for worker_id, beat in workers:
+        # SQLite hands DATETIME back as text
+        age = (now - datetime.fromisoformat(str(beat))).total_seconds()
+        print(f"{worker_id:<30} shards {held.get(worker_id, 0):>4}   heartbeat {age:6.1f}s ago")
+    print(f"{sum(held.values())}/{total} shards leased")
+
+def run_worker(engine, worker_id, every, ticks=None):
+    """Lease loop without fetching: prints the cities owned each tick."""
+    leases = ShardLeases(engine, worker_id=worker_id)
+    all_cities = [
+        city_key(city, info["code"])
+        for info in country_city.values() for city in info["cities"]
+    ]
+    tick = 0
+    try:
+        while ticks is None or tick < ticks:
+            owned = leases.heartbeat()
+            cities = leases.filter_cities(all_cities)
+            print(f"{datetime.now():%H:%M:%S} [{worker_id}] "
+                  f"shards={sorted(owned)} cities={len(cities)}", flush=True)
+            tick += 1
+            time.sleep(every)
+    finally:
+        leases.release_all()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion shard leases")
+    parser.add_argument("--worker", metavar="ID", help="run a dry-run lease loop as worker ID")
+    parser.add_argument("--every", type=float, default=5, help="seconds between heartbeats")
+    parser.add_argument("--ticks", type=int, help="stop after N heartbeats")
+    parser.add_argument("--status", action="store_true", help="show workers and leases")
+    args = parser.parse_args(argv)
+
+    if INGEST_SHARDS <= 0:
+        print("Set INGEST_SHARDS (e.g. 16) to enable sharded ingestion")
+        return 1
+
+    engine = get_engine()
+    ensure_tables(engine)
+
+    if args.worker:
+        # kill → SystemExit, so release_all() runs and others take over at once
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        run_worker(engine, args.worker, args.every, args.ticks)
+    else:
+        print_status(engine)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Per-stage timing metrics in Prometheus text format (no extra dependency).
+
+    with timer("http", endpoint="weather"):
+        ...
+
+Every timer feeds a histogram (weather_stage_seconds) and, when the block
+raises, an error counter (weather_stage_errors_total). The numbers can be
+scraped from a local endpoint (METRICS_PORT), written to a file for the
+node_exporter textfile collector (METRICS_FILE), or read as p50/p95 rows
+through summary() for the dashboard's debug panel.
+"""
+import os
+import re
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE")
+
+# Histogram upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Recent samples kept per series for the p50/p95 summary
+RECENT_SAMPLES = 1000
+
+_lock = threading.Lock()
+_series = {}      # (stage, labels) → {"buckets", "count", "sum", "errors", "recent"}
+
+
+def _new_series():
+    return {
+        "buckets": [0] * len(BUCKETS),
+        "count": 0,
+        "sum": 0.0,
+        "errors": 0,
+        "recent": deque(maxlen=RECENT_SAMPLES),
+    }
+
+def observe(stage, seconds, error=False, **labels):
+    """Records one timing for `stage` with optional extra labels."""
+    key = (stage, tuple(sorted(labels.items())))
+
+    with _lock:
+        s = _series.get(key)
+        if s is None:
+            s = _series[key] = _new_series()
+
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                s["buckets"][i] += 1
+        s["count"] += 1
+        s["sum"] += seconds
+        s["recent"].append(seconds)
+        if error:
+            s["errors"] += 1
+
+@contextmanager
+def timer(stage, **labels):
+    """Times the with-block; failures are counted and re-raised."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        observe(stage, time.perf_counter() - start, error=True, **labels)
+        raise
+    observe(stage, time.perf_counter() - start, **labels)
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+# -------------------------------------------------
+# SQL STATEMENTS (SQLAlchemy engine events)
+# -------------------------------------------------
+# First table named by the statement; ON covers CREATE INDEX ... ON t
+_TABLE_RE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?`?(\w+)",
+    re.IGNORECASE
+)
+
+def _sql_labels(statement):
+    words = statement.split(None, 1)
+    match = _TABLE_RE.search(statement)
+    return {
+        "op": words[0].lower() if words else "",
+        # SAVEPOINT, SELECT 1, ... touch no table
+        "table": match.group(1) if match else "none",
+    }
+
+def instrument_engine(engine):
+    """Times every statement the engine sends as stage "sql"."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["metrics_start"].pop()
+        observe("sql", time.perf_counter() - start, **_sql_labels(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        starts = context.connection.info.get("metrics_start") if context.connection else None
+        if starts:
+            observe("sql", time.perf_counter() - starts.pop(), error=True,
+                    **_sql_labels(context.statement or ""))
+
+    return engine
+
+
+# -------------------------------------------------
+# EXPOSITION
+# -------------------------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(stage, labels, extra=()):
+    pairs = [("stage", stage), *labels, *extra]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def render():
+    """All series in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = [
+            (stage, labels, dict(s, buckets=list(s["buckets"])))
+            for (stage, labels), s in sorted(_series.items())
+        ]
+
+    lines = [
+        "# HELP weather_stage_seconds Time spent per stage.",
+        "# TYPE weather_stage_seconds histogram",
+    ]
+    for stage, labels, s in snapshot:
+        for bound, n in zip(BUCKETS, s["buckets"]):
+            lines.append(
+                f"weather_stage_seconds_bucket{_label_text(stage, labels, [('le', bound)])} {n}"
+            )
+        lines.append(
+            f"weather_stage_seconds_bucket{_label_text(stage, labels, [('le', '+Inf')])} {s['count']}"
+        )
+        lines.append(f"weather_stage_seconds_sum{_label_text(stage, labels)} {s['sum']:.6f}")
+        lines.append(f"weather_stage_seconds_count{_label_text(stage, labels)} {s['count']}")
+
+    lines += [
+        "# HELP weather_stage_errors_total Failed calls per stage.",
+        "# TYPE weather_stage_errors_total counter",
+    ]
+    for stage, labels, s in snapshot:
+        lines.append(f"weather_stage_errors_total{_label_text(stage, labels)} {s['errors']}")
+
+    return "\n".join(lines) + "\n"
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summary():
+    """[{stage, labels, count, errors, p50_ms, p95_ms, total_s}] from recent samples."""
+    with _lock:
+        snapshot = [(stage, labels, s["count"], s["errors"], s["sum"], list(s["recent"]))
+                    for (stage, labels), s in sorted(_series.items())]
+
+    return [
+        {
+            "stage": stage,
+            "labels": ", ".join(f"{k}={v}" for k, v in labels),
+            "count": count,
+            "errors": errors,
+            "p50_ms": round(_percentile(recent, 0.50) * 1000, 1) if recent else None,
+            "p95_ms": round(_percentile(recent, 0.95) * 1000, 1) if recent else None,
+            "total_s": round(total, 3),
+        }
+        for stage, labels, count, errors, total, recent in snapshot
+    ]
+
+def write_textfile(path=None):
+    """Atomically writes render() to path (default METRICS_FILE)."""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+
+def start_server(port=None, host="127.0.0.1"):
+    """
+    Serves /metrics on a daemon thread (once per process).
+    Does nothing when no port is configured or the port is taken.
+    """
+    global _server
+    port = METRICS_PORT if port is None else port
+
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint not started: {e}")
+            return None
+
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,279 @@
+"""
+Versioned schema migrations for the weather database.
+
+    python migrate.py             # apply pending migrations, EXPLAIN before/after
+    python migrate.py --status    # list applied / pending versions
+    python migrate.py --explain   # only print the dashboard query plans
+"""
+import sys
+import argparse
+import pandas as pd
+from sqlalchemy import text
+
+from leases import LEASE_SCHEMA
+from scheduler import VIEWS_SCHEMA
+from weather_api import BUDGET_SCHEMA
+from weather_ingest import country_city, get_engine, DAY_PART_HOURS, LAST_INGESTED_SQL
+from weather_queries import (
+    PAST_WEEK_SQL, PAST_WEEK_PART_SQL, TODAY_SQL, TODAY_PART_SQL, PAST_DAILY_AVG_SQL,
+    past_window_params, today_params
+)
+
+
+# -------------------------------------------------
+# MIGRATION HELPERS
+# -------------------------------------------------
+def _index_exists(conn, table, name):
+    return conn.execute(
+        text("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+              AND table_name = :t AND index_name = :i
+        """),
+        {"t": table, "i": name}
+    ).scalar() > 0
+
+def add_index(table, name, columns):
+    """Step that creates an index unless one with that name exists."""
+    def step(conn):
+        if not _index_exists(conn, table, name):
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+    return step
+
+def sql(statement):
+    return lambda conn: conn.execute(text(statement))
+
+
+# -------------------------------------------------
+# MIGRATIONS (append only — never edit an applied version)
+# -------------------------------------------------
+MIGRATIONS = [
+    (1, "create weather tables", [
+        sql("""
+            CREATE TABLE IF NOT EXISTS weather_history (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                country VARCHAR(64) NOT NULL,
+                city VARCHAR(128) NOT NULL,
+                Temperature FLOAT,
+                humidity FLOAT,
+                wind FLOAT,
+                Dates_times DATETIME NOT NULL
+            )
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS weather_data (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                city VARCHAR(128) NOT NULL,
+                country VARCHAR(8) NOT NULL,
+                temperature_c FLOAT,
+                feels_like_c FLOAT,
+                humidity_percent INT,
+                pressure_hpa INT,
+                wind_speed_mps FLOAT,
+                weather_condition VARCHAR(64),
+                weather_description VARCHAR(128),
+                recorded_at DATETIME NOT NULL
+            )
+        """),
+    ]),
+    (2, "composite indexes for dashboard and retention queries", [
+        add_index("weather_history", "idx_history_country_city_time",
+                  "country, city, Dates_times"),
+        add_index("weather_data", "idx_data_recorded_at", "recorded_at"),
+    ]),
+    (3, "hourly and daily temperature rollups", [
+        sql("""
+            CREATE TABLE IF NOT EXISTS weather_hourly (
+                country VARCHAR(64) NOT NULL,
+                city VARCHAR(128) NOT NULL,
+                hour_start DATETIME NOT NULL,
+                n INT NOT NULL,
+                temp_sum DOUBLE NOT NULL,
+                temp_min FLOAT NOT NULL,
+                temp_max FLOAT NOT NULL,
+                PRIMARY KEY (country, city, hour_start)
+            )
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS weather_daily (
+                country VARCHAR(64) NOT NULL,
+                city VARCHAR(128) NOT NULL,
+                day DATE NOT NULL,
+                n INT NOT NULL,
+                temp_sum DOUBLE NOT NULL,
+                temp_min FLOAT NOT NULL,
+                temp_max FLOAT NOT NULL,
+                PRIMARY KEY (country, city, day)
+            )
+        """),
+        # Seed from existing history; ingestion keeps them current afterwards
+        sql("""
+            INSERT INTO weather_hourly
+                (country, city, hour_start, n, temp_sum, temp_min, temp_max)
+            SELECT country, city,
+                   TIMESTAMP(DATE(Dates_times), MAKETIME(HOUR(Dates_times), 0, 0)),
+                   COUNT(*), SUM(temperature), MIN(temperature), MAX(temperature)
+            FROM weather_history
+            GROUP BY country, city,
+                     TIMESTAMP(DATE(Dates_times), MAKETIME(HOUR(Dates_times), 0, 0))
+        """),
+        sql("""
+            INSERT INTO weather_daily
+                (country, city, day, n, temp_sum, temp_min, temp_max)
+            SELECT country, city, DATE(Dates_times),
+                   COUNT(*), SUM(temperature), MIN(temperature), MAX(temperature)
+            FROM weather_history
+            GROUP BY country, city, DATE(Dates_times)
+        """),
+    ]),
+    (4, "shard leases for sharded ingestion workers", [
+        sql(statement) for statement in LEASE_SCHEMA
+    ]),
+    (5, "per-city view counts for fetch scheduling", [
+        sql(statement) for statement in VIEWS_SCHEMA
+    ]),
+    (6, "day_part column for the dashboard time-of-day filter", [
+        sql("ALTER TABLE weather_history ADD COLUMN day_part TINYINT NULL"),
+        # Same rule as weather_ingest.day_part (hour // 6, IST wall clock)
+        sql("UPDATE weather_history SET day_part = HOUR(Dates_times) DIV 6"),
+        add_index("weather_history", "idx_history_country_city_part_time",
+                  "country, city, day_part, Dates_times"),
+    ]),
+    (7, "stored 5-day forecasts", [
+        sql("""
+            CREATE TABLE IF NOT EXISTS weather_forecast (
+                country VARCHAR(64) NOT NULL,
+                city VARCHAR(128) NOT NULL,
+                forecast_time DATETIME NOT NULL,
+                temperature FLOAT NOT NULL,
+                day_part TINYINT NOT NULL,
+                fetched_at DATETIME NOT NULL,
+                PRIMARY KEY (country, city, forecast_time)
+            )
+        """),
+    ]),
+    (8, "time index for weather_history retention deletes", [
+        # DELETE ... WHERE Dates_times < :cutoff LIMIT n then range-scans
+        # only expired rows instead of the whole table
+        add_index("weather_history", "idx_history_time", "Dates_times"),
+    ]),
+    (9, "shared OpenWeather call budget", [
+        sql(statement) for statement in BUDGET_SCHEMA
+    ]),
+]
+
+
+def ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+def applied_versions(conn):
+    return {
+        row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))
+    }
+
+def migrate(engine):
+    """Applies every pending migration, each in its own transaction."""
+    with engine.begin() as conn:
+        ensure_version_table(conn)
+        done = applied_versions(conn)
+
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+
+        with engine.begin() as conn:
+            for step in steps:
+                step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                {"v": version, "n": name}
+            )
+        print(f"Applied {version}: {name}")
+
+
+# -------------------------------------------------
+# EXPLAIN
+# -------------------------------------------------
+def explain_queries(engine):
+    country = next(iter(country_city))
+    city = country_city[country]["cities"][0]
+
+    queries = [
+        ("get_past_week", PAST_WEEK_SQL, past_window_params(country, city)),
+        ("get_past_week (Morning)", PAST_WEEK_PART_SQL,
+         {**past_window_params(country, city), "day_part": 1,
+          "part_hours": DAY_PART_HOURS}),
+        ("get_today_weather", TODAY_SQL, today_params(country, city)),
+        ("get_today_weather (Morning)", TODAY_PART_SQL,
+         {**today_params(country, city), "day_part": 1}),
+        ("get_past_daily_avg", PAST_DAILY_AVG_SQL,
+         {"c": country, "ci": city, "d": 5,
+          "today": today_params(country, city)["day_start"].date()}),
+        ("last ingested (MAX)", LAST_INGESTED_SQL, {}),
+    ]
+
+    with engine.connect() as conn:
+        for label, query, params in queries:
+            try:
+                result = conn.execute(text("EXPLAIN " + query.text), params)
+            except Exception as e:
+                # e.g. a rollup table that a pending migration creates
+                print(f"\n-- {label}: not available ({e.__class__.__name__})")
+                continue
+            plan = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+            cols = [c for c in ["table", "type", "key", "rows", "Extra"] if c in plan]
+            print(f"\n-- {label}")
+            print(plan[cols].to_string(index=False))
+
+
+# -------------------------------------------------
+# ENTRY POINT
+# -------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weather DB schema migrations")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--explain", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+
+    if args.status:
+        with engine.begin() as conn:
+            ensure_version_table(conn)
+            done = applied_versions(conn)
+        for version, name, _ in MIGRATIONS:
+            print(f"{'applied' if version in done else 'pending'}  {version}: {name}")
+        return 0
+
+    if args.explain:
+        explain_queries(engine)
+        return 0
+
+    with engine.begin() as conn:
+        ensure_version_table(conn)
+        pending = [m for m in MIGRATIONS if m[0] not in applied_versions(conn)]
+
+    if not pending:
+        print("Schema is up to date")
+        return 0
+
+    # Tables may not exist yet on a fresh database
+    if not any(version == 1 for version, _, _ in pending):
+        print("=== EXPLAIN before ===")
+        explain_queries(engine)
+
+    migrate(engine)
+
+    print("\n=== EXPLAIN after ===")
+    explain_queries(engine)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
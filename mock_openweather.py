@@ -0,0 +1,197 @@
+"""
+Local stand-in for the OpenWeather 2.5 API.
+
+Serves /weather, /group and /forecast with the same JSON shapes as
+api.openweathermap.org, using deterministic fake readings, so ingestion
+and the dashboard can run offline:
+
+    python mock_openweather.py --port 8001
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8001/data/2.5 streamlit run dashboard_app.py
+"""
+import sys
+import json
+import time
+import zlib
+import math
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+# id → (name, country) for every city looked up by name
+KNOWN_CITIES = {}
+_lock = threading.Lock()
+
+
+# -------------------------------------------------
+# FAKE READINGS
+# -------------------------------------------------
+def city_id(name, country):
+    return zlib.crc32(f"{name},{country}".lower().encode()) % 10_000_000
+
+def _temp_c(cid, ts):
+    # Stable per-city base + daily sine wave
+    base = 15 + (cid % 200) / 10
+    return round(base + 5 * math.sin((ts % 86400) / 86400 * 2 * math.pi), 2)
+
+def _convert(temp_c, units):
+    if units == "metric":
+        return temp_c
+    if units == "imperial":
+        return round(temp_c * 9 / 5 + 32, 2)
+    return round(temp_c + 273.15, 2)   # default: Kelvin
+
+def current_item(cid, units, ts=None):
+    ts = int(ts or time.time())
+    name, country = KNOWN_CITIES.get(cid, (f"City {cid}", "XX"))
+    temp = _temp_c(cid, ts)
+
+    return {
+        "coord": {"lon": 0.0, "lat": 0.0},
+        "weather": [{"id": 800, "main": "Clear", "description": "clear sky", "icon": "01d"}],
+        "main": {
+            "temp": _convert(temp, units),
+            "feels_like": _convert(temp - 1, units),
+            "temp_min": _convert(temp - 2, units),
+            "temp_max": _convert(temp + 2, units),
+            "pressure": 1000 + cid % 30,
+            "humidity": 40 + cid % 50,
+        },
+        "visibility": 10000,
+        "wind": {"speed": round(1 + (cid % 60) / 10, 2), "deg": cid % 360},
+        "clouds": {"all": cid % 100},
+        "dt": ts,
+        "sys": {"country": country},
+        "timezone": 0,
+        "id": cid,
+        "name": name,
+        "cod": 200,
+    }
+
+def forecast_payload(cid, units):
+    start = (int(time.time()) // 10800 + 1) * 10800   # next 3-hour slot
+    name, country = KNOWN_CITIES[cid]
+    items = []
+
+    for i in range(40):                                # 5 days × 8 slots
+        ts = start + i * 10800
+        item = current_item(cid, units, ts)
+        items.append({
+            "dt": ts,
+            "main": item["main"],
+            "weather": item["weather"],
+            "clouds": item["clouds"],
+            "wind": item["wind"],
+            "visibility": item["visibility"],
+            "pop": 0,
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts)),
+        })
+
+    return {
+        "cod": "200",
+        "message": 0,
+        "cnt": len(items),
+        "list": items,
+        "city": {"id": cid, "name": name, "country": country, "timezone": 0},
+    }
+
+
+# -------------------------------------------------
+# HTTP HANDLER
+# -------------------------------------------------
+class MockOpenWeatherHandler(BaseHTTPRequestHandler):
+    latency = 0.0   # seconds added to every response
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _lookup(self, params):
+        """Resolves ?q=city,country or ?id= to a city ID (or None)."""
+        if "id" in params:
+            return int(params["id"][0])
+        if "q" in params:
+            name, _, country = params["q"][0].partition(",")
+            name, country = name.strip(), country.strip().upper() or "XX"
+            if not name:
+                return None
+            cid = city_id(name, country)
+            with _lock:
+                KNOWN_CITIES.setdefault(cid, (name, country))
+            return cid
+        return None
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        units = params.get("units", [None])[0]
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        if not params.get("appid", [""])[0]:
+            return self._send(401, {"cod": 401, "message": "Invalid API key."})
+
+        if endpoint == "group":
+            ids = [int(i) for i in params.get("id", [""])[0].split(",") if i.strip()]
+            if len(ids) > 20:
+                return self._send(400, {"cod": "400", "message": "Too many ids"})
+            items = [current_item(i, units) for i in ids]
+            return self._send(200, {"cnt": len(items), "list": items})
+
+        cid = self._lookup(params)
+        if cid is None:
+            return self._send(404, {"cod": "404", "message": "city not found"})
+
+        if endpoint == "weather":
+            return self._send(200, current_item(cid, units))
+
+        if endpoint == "forecast":
+            KNOWN_CITIES.setdefault(cid, (f"City {cid}", "XX"))
+            return self._send(200, forecast_payload(cid, units))
+
+        self._send(404, {"cod": "404", "message": "Internal error"})
+
+
+# -------------------------------------------------
+# ENTRY POINTS
+# -------------------------------------------------
+def serve_in_thread(host="127.0.0.1", port=0, latency=0.0):
+    """
+    Starts the mock on a daemon thread (port=0 picks a free port).
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = type("Handler", (MockOpenWeatherHandler,), {"latency": latency})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://{host}:{server.server_address[1]}/data/2.5"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenWeather stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds of simulated network delay per request")
+    args = parser.parse_args(argv)
+
+    handler = type("Handler", (MockOpenWeatherHandler,), {"latency": args.latency})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Mock OpenWeather on http://{args.host}:{args.port}/data/2.5")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Retention for weather_data, weather_history, city_views and weather_forecast.
+
+Partitioned tables (daily RANGE partitions on TO_DAYS(time column)) expire
+by dropping whole partitions, which is constant-cost and lock-light.
+Unpartitioned tables fall back to small DELETE ... LIMIT chunks, each in its
+own transaction with a pause in between, so dashboard reads never wait on
+one long delete.
+
+    python retention.py                       # apply retention once
+    python retention.py --partition weather_history   # convert a table (one-off)
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from metrics import timer
+from weather_ingest import IST, get_engine
+
+
+# table → (time column, days to keep)
+RETENTION = {
+    "weather_data": ("recorded_at", int(os.getenv("WEATHER_DATA_RETENTION_DAYS", "7"))),
+    "weather_history": ("Dates_times", int(os.getenv("WEATHER_HISTORY_RETENTION_DAYS", "30"))),
+    "city_views": ("hour_start", int(os.getenv("CITY_VIEWS_RETENTION_DAYS", "2"))),
+    # Slots of forecasts for cities that are no longer refreshed
+    "weather_forecast": ("forecast_time", int(os.getenv("WEATHER_FORECAST_RETENTION_DAYS", "1"))),
+}
+
+# Tables with an id primary key, which partition_table extends
+PARTITIONABLE = ("weather_data", "weather_history")
+
+DELETE_CHUNK_ROWS = int(os.getenv("RETENTION_CHUNK_ROWS", "1000"))
+DELETE_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.2"))
+
+# Daily partitions created ahead of time
+PARTITIONS_AHEAD_DAYS = int(os.getenv("PARTITIONS_AHEAD_DAYS", "3"))
+
+# MySQL TO_DAYS(d) == d.toordinal() + 365
+_TO_DAYS_OFFSET = 365
+
+
+def _today():
+    return datetime.now(IST).date()
+
+def _to_days(day):
+    return day.toordinal() + _TO_DAYS_OFFSET
+
+
+# -------------------------------------------------
+# PARTITIONS
+# -------------------------------------------------
+def list_partitions(conn, table):
+    """[(name, upper bound as TO_DAYS int or None for MAXVALUE)], in order."""
+    rows = conn.execute(
+        text("""
+            SELECT partition_name, partition_description
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE()
+              AND table_name = :t
+              AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        """),
+        {"t": table}
+    ).fetchall()
+
+    return [
+        (name, None if bound == "MAXVALUE" else int(bound))
+        for name, bound in rows
+    ]
+
+def ensure_future_partitions(conn, table, partitions, ahead=PARTITIONS_AHEAD_DAYS):
+    """Splits pmax so every day up to today+ahead has its own partition."""
+    if not partitions or partitions[-1][0] != "pmax":
+        return
+
+    highest = max((bound for _, bound in partitions if bound is not None), default=None)
+    wanted = []
+    for offset in range(ahead + 1):
+        day = _today() + timedelta(days=offset)
+        upper = _to_days(day + timedelta(days=1))
+        if highest is None or upper > highest:
+            wanted.append(
+                f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({upper})"
+            )
+
+    if wanted:
+        conn.execute(text(
+            f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+            + ", ".join(wanted)
+            + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+
+def drop_expired_partitions(conn, table, partitions, keep_days):
+    """Drops every partition whose rows are all older than the cutoff."""
+    cutoff = _to_days(_today() - timedelta(days=keep_days))
+    expired = [name for name, bound in partitions if bound is not None and bound <= cutoff]
+
+    if expired:
+        conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+    return len(expired)
+
+def partition_table(engine, table):
+    """
+    One-off conversion of a table to daily RANGE partitions.
+    Rewrites the table, so run it in a quiet window.
+    """
+    column, _ = RETENTION[table]
+    first_day = _to_days(_today())
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})"
+        ))
+        conn.execute(text(f"""
+            ALTER TABLE {table}
+            PARTITION BY RANGE (TO_DAYS({column})) (
+                PARTITION p_before VALUES LESS THAN ({first_day}),
+                PARTITION pmax VALUES LESS THAN MAXVALUE
+            )
+        """))
+        ensure_future_partitions(conn, table, list_partitions(conn, table))
+
+
+# -------------------------------------------------
+# CHUNKED DELETE FALLBACK
+# -------------------------------------------------
+def delete_in_chunks(engine, table, column, keep_days,
+                     chunk=DELETE_CHUNK_ROWS, pause=DELETE_PAUSE_SECONDS):
+    """
+    Deletes expired rows `chunk` at a time; each chunk commits on its
+    own so locks are held only briefly. `column` must lead an index
+    (migrations 2 and 8), or every chunk scans and locks the table.
+    """
+    cutoff = datetime.now(IST).replace(tzinfo=None) - timedelta(days=keep_days)
+    total = 0
+
+    while True:
+        with engine.begin() as conn:
+            deleted = conn.execute(
+                text(f"DELETE FROM {table} WHERE {column} < :cutoff LIMIT :n"),
+                {"cutoff": cutoff, "n": chunk}
+            ).rowcount
+        total += deleted
+
+        if deleted < chunk:
+            return total
+        time.sleep(pause)
+
+
+# -------------------------------------------------
+# ENTRY POINTS
+# -------------------------------------------------
+def apply_retention(engine, tables=None):
+    """
+    Expires old rows for each configured table.
+    Returns {table: partitions dropped or rows deleted}.
+    """
+    results = {}
+
+    for table in tables or RETENTION:
+        column, keep_days = RETENTION[table]
+
+        with timer("retention", table=table):
+            with engine.begin() as conn:
+                partitions = list_partitions(conn, table)
+                if partitions:
+                    ensure_future_partitions(conn, table, partitions)
+                    results[table] = drop_expired_partitions(conn, table, partitions, keep_days)
+                    print(f"{table}: dropped {results[table]} partition(s)")
+                    continue
+
+            results[table] = delete_in_chunks(engine, table, column, keep_days)
+            print(f"{table}: deleted {results[table]} row(s)")
+
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weather table retention")
+    parser.add_argument("--partition", choices=PARTITIONABLE,
+                        help="convert TABLE to daily partitions (one-off)")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+
+    if args.partition:
+        partition_table(engine, args.partition)
+        print(f"{args.partition} is now partitioned by day")
+        return 0
+
+    apply_retention(engine)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Staleness- and demand-ordered fetch scheduling for weather_history.
+
+The dashboard counts which cities people open (record_views) and flushes
+the counts to city_views once a minute. Each ingestion tick then:
+
+  1. gives every city an effective interval: INTERVAL_MINUTES when it is
+     being watched, IDLE_BACKOFF x that when nobody has looked lately
+  2. scores due cities by staleness x (1 + log(1 + demand))
+  3. pops the best ones off a heap, only as many calls as the tick can
+     afford (tick_budget: tokens on hand + refill, a share kept for
+     forecasts); the rest wait a tick and come back staler
+"""
+import os
+import math
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from weather_api import API_BUCKET, GROUP_SIZE
+
+
+# Views older than this count half as much
+DEMAND_HALF_LIFE_HOURS = float(os.getenv("DEMAND_HALF_LIFE_HOURS", "6"))
+DEMAND_WINDOW_HOURS = 24
+
+# Interval multiplier for cities with no recent views
+IDLE_BACKOFF = float(os.getenv("IDLE_BACKOFF", "3"))
+
+VIEW_FLUSH_SECONDS = int(os.getenv("VIEW_FLUSH_SECONDS", "60"))
+
+# Part of each tick's API budget kept for /forecast calls
+FORECAST_BUDGET_SHARE = float(os.getenv("FORECAST_BUDGET_SHARE", "0.25"))
+
+VIEWS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS city_views (
+        country VARCHAR(64) NOT NULL,
+        city VARCHAR(128) NOT NULL,
+        hour_start DATETIME NOT NULL,
+        views INT NOT NULL,
+        PRIMARY KEY (country, city, hour_start)
+    )
+    """,
+]
+
+_views = Counter()
+_views_lock = threading.Lock()
+_last_flush = datetime.min
+
+
+def _utc_hour(now=None):
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+# -------------------------------------------------
+# VIEW DEMAND (dashboard side)
+# -------------------------------------------------
+def record_views(country, cities):
+    """Counts one view for each city (in memory until flush_views)."""
+    with _views_lock:
+        for city in cities:
+            _views[(country, city)] += 1
+
+def flush_views(engine, min_interval=VIEW_FLUSH_SECONDS):
+    """
+    Adds the buffered counts to this hour's city_views rows, at most
+    once per min_interval. Failures are logged, never raised: view
+    counts only steer scheduling.
+    """
+    global _last_flush
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    with _views_lock:
+        if (now - _last_flush).total_seconds() < min_interval or not _views:
+            return
+        pending = dict(_views)
+        _views.clear()
+        _last_flush = now
+
+    hour = _utc_hour(now)
+    try:
+        with engine.begin() as conn:
+            for (country, city), n in pending.items():
+                params = {"country": country, "city": city, "hour": hour, "n": n}
+                updated = conn.execute(
+                    text("""
+                        UPDATE city_views SET views = views + :n
+                        WHERE country = :country AND city = :city AND hour_start = :hour
+                    """),
+                    params
+                ).rowcount
+                if not updated:
+                    conn.execute(
+                        text("""
+                            INSERT INTO city_views (country, city, hour_start, views)
+                            VALUES (:country, :city, :hour, :n)
+                        """),
+                        params
+                    )
+    except SQLAlchemyError as e:
+        print(f"Could not record city views: {e}")
+
+
+# -------------------------------------------------
+# SCHEDULING (ingestion side)
+# -------------------------------------------------
+def load_demand(engine):
+    """
+    {(country, city): decayed view count over the last day}.
+    Empty when city_views is missing or nobody has viewed anything.
+    """
+    now = _utc_hour()
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT country, city, hour_start, views FROM city_views
+                    WHERE hour_start >= :since
+                """),
+                {"since": now - timedelta(hours=DEMAND_WINDOW_HOURS)}
+            ).fetchall()
+    except SQLAlchemyError as e:
+        print(f"City demand unavailable: {e}")
+        return {}
+
+    demand = Counter()
+    for country, city, hour_start, views in rows:
+        # SQLite hands DATETIME back as text
+        age = (now - datetime.fromisoformat(str(hour_start))).total_seconds() / 3600
+        demand[(country, city)] += views * 0.5 ** (age / DEMAND_HALF_LIFE_HOURS)
+    return dict(demand)
+
+def plan_fetches(candidates, last_seen, now, interval_minutes, demand=None,
+                 budget=None, per_call=1):
+    """
+    Picks which (country, country_code, city) candidates to fetch now,
+    most urgent first.
+
+    demand: load_demand() output; None disables demand weighting and
+            idle back-off (plain interval gap check)
+    budget: API calls allowed (default: API_BUCKET tokens available)
+    per_call: cities one call covers (GROUP_SIZE in group mode)
+    """
+    weigh = bool(demand)
+    heap = []
+
+    for job in candidates:
+        country, _, city = job
+        views = demand.get((country, city), 0.0) if weigh else 0.0
+        interval = interval_minutes
+        if weigh and views < 1:
+            interval *= IDLE_BACKOFF
+
+        last_time = last_seen.get((country, city))
+        if last_time is None:
+            staleness = math.inf        # never ingested → first in line
+        else:
+            age_minutes = (now - last_time).total_seconds() / 60
+            if age_minutes < interval:
+                continue
+            staleness = age_minutes / max(interval, 1e-9)
+
+        priority = staleness * (1 + math.log1p(views))
+        heapq.heappush(heap, (-priority, len(heap), job))
+
+    if budget is None:
+        budget = API_BUCKET.available()
+    limit = len(heap) if budget == math.inf else int(budget) * per_call
+
+    return [heapq.heappop(heap)[2] for _ in range(min(limit, len(heap)))]
+
+def tick_budget(seconds, workers=1):
+    """
+    API calls one worker may plan for the next `seconds`: tokens on hand
+    plus the refill over that time, split between `workers`. acquire()
+    paces the calls, so the plan can exceed the burst.
+    Returns (live, forecast) budgets, FORECAST_BUDGET_SHARE for forecasts.
+    """
+    if API_BUCKET.rate <= 0:
+        return math.inf, math.inf
+    total = (API_BUCKET.available() + API_BUCKET.rate * seconds) / max(1, workers)
+    forecast = int(total * FORECAST_BUDGET_SHARE)
+    return int(total) - forecast, forecast
+
+def cities_per_call(mode):
+    return GROUP_SIZE if mode == "group" else 1
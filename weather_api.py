@@ -0,0 +1,502 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from metrics import timer
+
+
+# -------------------------------------------------
+# OPENWEATHER ENDPOINTS
+# -------------------------------------------------
+# Point this at mock_openweather.py to run everything offline, e.g.
+#   OPENWEATHER_BASE_URL=http://127.0.0.1:8001/data/2.5
+OPENWEATHER_BASE_URL = os.getenv(
+    "OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5"
+).rstrip("/")
+
+# OpenWeather accepts at most 20 city IDs per /group call
+GROUP_SIZE = 20
+
+# city,country → OpenWeather city ID (persists across runs)
+CITY_ID_CACHE_PATH = os.getenv("CITY_ID_CACHE", ".city_ids.json")
+
+
+# HTTP client: (connect, read) timeouts, retries on 429/5xx, pooled sockets
+HTTP_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Response cache: fresh for TTL seconds, then served stale for GRACE
+# seconds while one background refresh runs
+CACHE_TTLS = {
+    "weather": int(os.getenv("CURRENT_TTL_SECONDS", "600")),      # ~10 min updates
+    "forecast": int(os.getenv("FORECAST_TTL_SECONDS", "10800")),  # 3-hour steps
+}
+CACHE_GRACE = {
+    "weather": int(os.getenv("CURRENT_GRACE_SECONDS", "300")),
+    "forecast": int(os.getenv("FORECAST_GRACE_SECONDS", "1800")),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+
+# Client-side quota for the API key (free keys: ~60 calls/minute). Every
+# process that calls API_BUCKET.share(engine) draws from the same budget
+# in api_budget; otherwise it is per process. 0 disables the limit.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+# Small burst: a full bucket plus refill must stay under the quota in
+# any rolling minute
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_WAIT = float(os.getenv("RATE_LIMIT_WAIT_SECONDS", "30"))
+
+BUDGET_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS api_budget (
+        name VARCHAR(64) PRIMARY KEY,
+        tokens DOUBLE NOT NULL,
+        updated_at DOUBLE NOT NULL,
+        version INT NOT NULL
+    )
+    """,
+]
+
+
+# -------------------------------------------------
+# SHARED HTTP CLIENT
+# -------------------------------------------------
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    One keep-alive requests.Session per process, so TLS handshakes are
+    paid once per pooled connection instead of once per request.
+
+    Retries 429/5xx with exponential backoff + jitter and honours
+    Retry-After. requests is imported here, on the first call, so
+    importing this module stays cheap.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=HTTP_BACKOFF,
+                    backoff_jitter=HTTP_BACKOFF,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET"],
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+
+# -------------------------------------------------
+# RATE LIMIT (global token bucket)
+# -------------------------------------------------
+class ApiError(OSError):
+    """Any failed OpenWeather call: network error, bad body, no token."""
+
+class RateLimited(ApiError):
+    """No token within RATE_LIMIT_WAIT; handled like any request error."""
+
+class TokenBucket:
+    """
+    `rate_per_minute` tokens refill continuously up to `capacity`; every
+    API call takes one. pause() empties the bucket after a 429.
+
+    After share(engine) the bucket lives in one api_budget row, so the
+    dashboard, the service and every sharded worker spend ONE budget.
+    """
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.engine = None
+        self.name = None
+
+    def share(self, engine, name="openweather"):
+        """
+        Moves the bucket into api_budget (created if missing). Keeps the
+        local bucket when the database can't be reached.
+        """
+        if self.rate <= 0 or self.engine is not None:
+            return self
+        from sqlalchemy import text
+        from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+        try:
+            with engine.begin() as conn:
+                for statement in BUDGET_SCHEMA:
+                    conn.execute(text(statement))
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text("""
+                            INSERT INTO api_budget (name, tokens, updated_at, version)
+                            VALUES (:name, :tokens, :now, 0)
+                        """),
+                        {"name": name, "tokens": self.capacity, "now": time.time()}
+                    )
+            except IntegrityError:
+                pass    # another process created it first
+        except SQLAlchemyError as e:
+            print(f"Shared API budget unavailable, limiting per process: {e}")
+            return self
+
+        self.engine, self.name = engine, name
+        return self
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _update_shared(self, spend):
+        from sqlalchemy import text
+
+        while True:
+            with self.engine.begin() as conn:
+                tokens, updated, version = conn.execute(
+                    text("SELECT tokens, updated_at, version FROM api_budget WHERE name = :name"),
+                    {"name": self.name}
+                ).one()
+                now = time.time()
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                new_tokens, result = spend(tokens)
+                if new_tokens is None:
+                    return result
+
+                # Compare-and-set: lost races re-read and try again
+                swapped = conn.execute(
+                    text("""
+                        UPDATE api_budget
+                        SET tokens = :tokens, updated_at = :now, version = version + 1
+                        WHERE name = :name AND version = :version
+                    """),
+                    {"tokens": new_tokens, "now": now, "name": self.name, "version": version}
+                ).rowcount
+            if swapped:
+                return result
+
+    def _update(self, spend):
+        """
+        Refills, then spend(tokens) → (new token count or None to leave
+        it, result). Shared buckets fall back to local on DB errors.
+        """
+        if self.engine is not None:
+            from sqlalchemy.exc import SQLAlchemyError
+            try:
+                return self._update_shared(spend)
+            except SQLAlchemyError as e:
+                print(f"Shared API budget failed, limiting per process: {e}")
+
+        with self.lock:
+            self._refill(time.monotonic())
+            new_tokens, result = spend(self.tokens)
+            if new_tokens is not None:
+                self.tokens = new_tokens
+            return result
+
+    def available(self):
+        """Whole tokens that can be spent right now."""
+        if self.rate <= 0:
+            return float("inf")
+        return self._update(lambda tokens: (None, int(tokens)))
+
+    def _take(self, tokens):
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return None, (1 - tokens) / self.rate
+
+    def acquire(self, timeout=RATE_LIMIT_WAIT):
+        """Takes one token, waiting up to `timeout` seconds. Returns success."""
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+
+        while True:
+            wait = self._update(self._take)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Spends the next `seconds` worth of tokens (server said slow down)."""
+        self._update(lambda tokens: (min(tokens, 0) - seconds * self.rate, None))
+
+API_BUCKET = TokenBucket(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+
+def api_get(endpoint, params, wait=RATE_LIMIT_WAIT):
+    """
+    GET {OPENWEATHER_BASE_URL}/{endpoint} through the shared session.
+    Returns the decoded JSON body (error bodies included).
+
+    Every call takes a token from API_BUCKET first; raises RateLimited
+    when none frees up within `wait` seconds, and ApiError for any other
+    failure, so callers catch ApiError (or OSError) and nothing else.
+    """
+    if not API_BUCKET.acquire(timeout=wait):
+        raise RateLimited(f"OpenWeather rate limit: no token for /{endpoint}")
+
+    try:
+        with timer("http", endpoint=endpoint):
+            response = get_session().get(
+                f"{OPENWEATHER_BASE_URL}/{endpoint}",
+                params=params,
+                timeout=HTTP_TIMEOUT
+            )
+
+        if response.status_code == 429:
+            # Still throttled after the session's own retries: back off globally
+            retry_after = response.headers.get("Retry-After", "")
+            API_BUCKET.pause(float(retry_after) if retry_after.isdigit() else 60)
+
+        return response.json()
+    # requests errors are OSErrors; a non-JSON body raises ValueError
+    except (OSError, ValueError) as e:
+        raise ApiError(f"/{endpoint}: {e}") from e
+
+
+# -------------------------------------------------
+# SHARED RESPONSE CACHE (TTL + LRU + stale-while-revalidate)
+# -------------------------------------------------
+class ResponseCache:
+    """
+    Process-wide cache shared by every Streamlit session.
+
+    get(key, loader, ttl, grace, keep):
+      * fresh hit          → cached value
+      * stale within grace → cached value now, loader() re-run in background
+      * miss / too stale   → loader() runs once, concurrent callers wait on it
+    Only values for which keep(value) is true are stored.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key → (stored_at, value)
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.refreshing = set()
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, keep):
+        if not keep(value):
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)   # evict LRU
+                self.key_locks.pop(old_key, None)
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key, loader, keep):
+        try:
+            self._store(key, loader(), keep)
+        except Exception as e:
+            print(f"Background refresh failed for {key}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def get(self, key, loader, ttl, grace=0, keep=lambda value: True):
+        entry = self._lookup(key)
+        if entry is not None:
+            stored_at, value = entry
+            age = time.monotonic() - stored_at
+            if age < ttl:
+                return value
+            if age < ttl + grace:
+                with self.lock:
+                    start = key not in self.refreshing
+                    self.refreshing.add(key)
+                if start:
+                    threading.Thread(
+                        target=self._refresh, args=(key, loader, keep), daemon=True
+                    ).start()
+                return value
+
+        # Miss: one upstream call per key, however many viewers ask
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                return entry[1]
+            value = loader()
+            self._store(key, value, keep)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def _get_json(endpoint, city, country_code, api_key, wait=RATE_LIMIT_WAIT):
+    return api_get(
+        endpoint,
+        {"q": f"{city},{country_code}", "appid": api_key, "units": "metric"},
+        wait=wait
+    )
+
+def get_current_weather_json(city, country_code, api_key, wait=RATE_LIMIT_WAIT):
+    """
+    Raw /weather response (metric), served from RESPONSE_CACHE.
+    A miss waits at most `wait` seconds for an API token.
+    """
+    return RESPONSE_CACHE.get(
+        (city, country_code, "weather"),
+        lambda: _get_json("weather", city, country_code, api_key, wait),
+        ttl=CACHE_TTLS["weather"],
+        grace=CACHE_GRACE["weather"],
+        keep=lambda res: "main" in res
+    )
+
+def get_forecast_json(city, country_code, api_key, wait=RATE_LIMIT_WAIT):
+    """
+    Raw /forecast response (metric), served from RESPONSE_CACHE.
+    A miss waits at most `wait` seconds for an API token.
+    """
+    return RESPONSE_CACHE.get(
+        (city, country_code, "forecast"),
+        lambda: _get_json("forecast", city, country_code, api_key, wait),
+        ttl=CACHE_TTLS["forecast"],
+        grace=CACHE_GRACE["forecast"],
+        keep=lambda res: "list" in res
+    )
+
+
+# -------------------------------------------------
+# CITY ID CACHE
+# -------------------------------------------------
+def _city_key(city, country_code):
+    return f"{city},{country_code}"
+
+def load_city_ids(path=CITY_ID_CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_city_ids(city_ids, path=CITY_ID_CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(city_ids, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"Could not save city ID cache: {e}")
+
+def resolve_city_ids(cities, api_key, path=CITY_ID_CACHE_PATH):
+    """
+    Maps (city, country_code) pairs to OpenWeather city IDs.
+
+    Only cities missing from the on-disk cache cost an API call
+    (one ?q= lookup each, the first time they are seen).
+    """
+    city_ids = load_city_ids(path)
+    changed = False
+
+    for city, country_code in cities:
+        key = _city_key(city, country_code)
+        if key in city_ids:
+            continue
+
+        try:
+            res = api_get("weather", {"q": key, "appid": api_key})
+        except ApiError as e:
+            print(f"Error resolving {key}: {e}")
+            continue
+
+        if "id" not in res:
+            print(f"Error resolving {key}: {res.get('message', 'API Error')}")
+            continue
+
+        city_ids[key] = res["id"]
+        changed = True
+
+    if changed:
+        save_city_ids(city_ids, path)
+
+    return {
+        (city, country_code): city_ids[_city_key(city, country_code)]
+        for city, country_code in cities
+        if _city_key(city, country_code) in city_ids
+    }
+
+
+# -------------------------------------------------
+# GROUP ENDPOINT (up to 20 cities per call)
+# -------------------------------------------------
+def fetch_group(city_ids, api_key, units=None):
+    """
+    Current weather for up to GROUP_SIZE city IDs in ONE request.
+    Returns {city_id: response item}.
+    """
+    params = {"id": ",".join(str(i) for i in city_ids), "appid": api_key}
+    if units:
+        params["units"] = units
+
+    res = api_get("group", params)
+
+    return {item["id"]: item for item in res.get("list", []) if "main" in item}
+
+def fetch_current_many(cities, api_key, units="metric"):
+    """
+    Current weather for many (city, country_code) pairs using cached
+    city IDs and the /group endpoint, GROUP_SIZE cities per call.
+
+    Returns {(city, country_code): response item}; cities that could not
+    be resolved or fetched are simply missing from the result.
+    """
+    ids = resolve_city_ids(cities, api_key)
+    by_id = {city_id: pair for pair, city_id in ids.items()}
+    id_list = list(by_id)
+
+    results = {}
+    for start in range(0, len(id_list), GROUP_SIZE):
+        chunk = id_list[start:start + GROUP_SIZE]
+        try:
+            items = fetch_group(chunk, api_key, units=units)
+        except ApiError as e:
+            print(f"Error for group {chunk}: {e}")
+            continue
+
+        for city_id, item in items.items():
+            if city_id in by_id:
+                results[by_id[city_id]] = item
+
+    return results
@@ -0,0 +1,664 @@
+import os
+from dotenv import load_dotenv
+from urllib.parse import quote_plus
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, text
+from datetime import timezone, timedelta
+
+from metrics import instrument_engine, timer
+from scheduler import cities_per_call, plan_fetches
+from weather_api import GROUP_SIZE, ApiError, api_get, fetch_current_many
+
+
+IST = timezone(timedelta(hours=5, minutes=30))
+# -------------------------------------------------
+# LOAD ENV (LOCAL + STREAMLIT + RAILWAY SAFE)
+# -------------------------------------------------
+load_dotenv()
+
+API_KEY = os.getenv("OPENWEATHER_API_KEY") or "YOUR_API_KEY"
+
+# Max number of OpenWeather requests in flight during live ingestion
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+
+# "city": one ?q= request per city | "group": cached city IDs + /group (20 per call)
+INGEST_MODE = os.getenv("INGEST_MODE", "city")
+
+# Rows sent per multi-row INSERT (one network round-trip each)
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "100"))
+
+# OpenWeather publishes a new 5-day / 3-hour forecast every 3 hours
+FORECAST_INTERVAL_MINUTES = int(os.getenv("FORECAST_INTERVAL_MINUTES", "180"))
+
+
+def get_engine():
+    """
+    Builds the SQLAlchemy engine for weather_history from env vars.
+    Raises RuntimeError when the database settings are missing.
+    """
+    db_user = os.getenv("MYSQLUSER") or os.getenv("DB_USER")
+    raw_password = os.getenv("MYSQLPASSWORD") or os.getenv("DB_PASSWORD")
+    db_host = os.getenv("MYSQLHOST") or os.getenv("DB_HOST")
+    db_port = os.getenv("MYSQLPORT") or os.getenv("DB_PORT")
+    db_name = os.getenv("MYSQLDATABASE") or os.getenv("DB_NAME")
+
+    # Local stand-in (e.g. sqlite:///bench.db for benchmark.py)
+    if os.getenv("DATABASE_URL"):
+        return _local_engine(os.getenv("DATABASE_URL"))
+
+    if not all([db_user, raw_password, db_host, db_port, db_name]):
+        raise RuntimeError("Database environment variables are missing")
+
+    db_port = int(db_port)
+    db_password = quote_plus(raw_password)
+
+    return instrument_engine(create_engine(
+        f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}",
+        pool_pre_ping=True
+    ))
+
+def _local_engine(url):
+    """
+    Engine for DATABASE_URL. SQLite connections get the MySQL
+    functions the dashboard queries use (UNIX_TIMESTAMP, FLOOR, HOUR).
+    """
+    engine = create_engine(url)
+
+    if engine.dialect.name == "sqlite":
+        import math
+
+        @event.listens_for(engine, "connect")
+        def _mysql_functions(dbapi_conn, _):
+            dbapi_conn.create_function(
+                "UNIX_TIMESTAMP", 1,
+                lambda v: pd.Timestamp(v).timestamp() if v is not None else None
+            )
+            dbapi_conn.create_function(
+                "FLOOR", 1, lambda v: math.floor(v) if v is not None else None
+            )
+            dbapi_conn.create_function(
+                "HOUR", 1, lambda v: pd.Timestamp(v).hour if v is not None else None
+            )
+
+    return instrument_engine(engine)
+
+# -------------------------------------------------
+# COUNTRY & CITY DATA
+# -------------------------------------------------
+country_city = {
+    "India": {
+        "code": "IN",
+        "cities": [
+            "Bangalore", "Delhi", "Mumbai", "Chennai", "Hyderabad",
+            "Kolkata", "Pune", "Ahmedabad", "Jaipur", "Trichy"
+        ]
+    },
+
+    "USA": {
+        "code": "US",
+        "cities": [
+            "New York", "Los Angeles", "Chicago", "Houston", "Phoenix",
+            "San Francisco", "San Diego", "Dallas", "Seattle", "Boston"
+        ]
+    },
+
+    "UK": {
+        "code": "GB",
+        "cities": [
+            "London", "Manchester", "Birmingham", "Liverpool",
+            "Leeds", "Bristol", "Nottingham"
+        ]
+    }
+
+
+}
+
+
+# -------------------------------------------------
+# BATCHED WRITES
+# -------------------------------------------------
+class BatchWriter:
+    """
+    Collects rows and flushes them batch_size at a time through
+    execute_many(rows) (executemany / multi-row VALUES).
+
+    If a batch fails, its rows are retried one by one so a bad row is
+    reported and skipped exactly like the old per-row inserts.
+    """
+
+    def __init__(self, execute_many, batch_size=INSERT_BATCH_SIZE, describe=str):
+        self.execute_many = execute_many
+        self.batch_size = max(1, batch_size)
+        self.describe = describe
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+
+        try:
+            self.execute_many(rows)
+            self.written += len(rows)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                print(f"Error for {self.describe(rows[0])}: {e}")
+                return
+
+        # ⚠️ Isolate the failing row(s)
+        for row in rows:
+            try:
+                self.execute_many([row])
+                self.written += 1
+            except Exception as e:
+                print(f"Error for {self.describe(row)}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+# -------------------------------------------------
+# INGESTION (weather_history)
+# -------------------------------------------------
+INSERT_HISTORY_SQL = text("""
+    INSERT INTO weather_history
+    (country, city, Temperature, humidity, wind, Dates_times, day_part)
+    VALUES (:country, :city, :temperature, :humidity, :wind, :dt, :day_part)
+""")
+
+# day_part = hour // 6 → 0 Night, 1 Morning, 2 Afternoon, 3 Evening (IST),
+# stored with every row so the dashboard's time filter runs in SQL
+DAY_PART_HOURS = 6
+
+def day_part(dt):
+    return dt.hour // DAY_PART_HOURS
+
+
+# -------------------------------------------------
+# ROLLUPS (weather_hourly / weather_daily)
+# -------------------------------------------------
+# Each batch is pre-aggregated in Python, then merged into the rollup
+# rows with one upsert per table (count, sum, min, max).
+_ROLLUP_UPSERT = {
+    "mysql": """
+        INSERT INTO {table} (country, city, {period}, n, temp_sum, temp_min, temp_max)
+        VALUES (:country, :city, :period, :n, :temp_sum, :temp_min, :temp_max)
+        ON DUPLICATE KEY UPDATE
+            n = n + VALUES(n),
+            temp_sum = temp_sum + VALUES(temp_sum),
+            temp_min = LEAST(temp_min, VALUES(temp_min)),
+            temp_max = GREATEST(temp_max, VALUES(temp_max))
+    """,
+    # Local SQLite stand-in (benchmark.py)
+    "sqlite": """
+        INSERT INTO {table} (country, city, {period}, n, temp_sum, temp_min, temp_max)
+        VALUES (:country, :city, :period, :n, :temp_sum, :temp_min, :temp_max)
+        ON CONFLICT (country, city, {period}) DO UPDATE SET
+            n = n + excluded.n,
+            temp_sum = temp_sum + excluded.temp_sum,
+            temp_min = MIN(temp_min, excluded.temp_min),
+            temp_max = MAX(temp_max, excluded.temp_max)
+    """,
+}
+
+def _rollup_upsert(conn, table, period):
+    dialect = "sqlite" if conn.dialect.name == "sqlite" else "mysql"
+    return text(_ROLLUP_UPSERT[dialect].format(table=table, period=period))
+
+
+def _wall_clock(dt):
+    """IST wall-clock time as stored in Dates_times (DATETIME has no tz)."""
+    ts = pd.Timestamp(dt)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(IST).tz_localize(None)
+    return ts.to_pydatetime()
+
+def rollup_rows(rows, period_of):
+    """
+    Aggregates history rows into {country, city, period, n, sum, min, max}
+    dicts, one per (country, city, period_of(dt)).
+    """
+    groups = {}
+    for row in rows:
+        key = (row["country"], row["city"], period_of(_wall_clock(row["dt"])))
+        temp = float(row["temperature"])
+        agg = groups.get(key)
+        if agg is None:
+            groups[key] = {
+                "country": key[0], "city": key[1], "period": key[2],
+                "n": 1, "temp_sum": temp, "temp_min": temp, "temp_max": temp
+            }
+        else:
+            agg["n"] += 1
+            agg["temp_sum"] += temp
+            agg["temp_min"] = min(agg["temp_min"], temp)
+            agg["temp_max"] = max(agg["temp_max"], temp)
+    return list(groups.values())
+
+def update_rollups(conn, rows):
+    conn.execute(
+        _rollup_upsert(conn, "weather_hourly", "hour_start"),
+        rollup_rows(rows, lambda dt: dt.replace(minute=0, second=0, microsecond=0))
+    )
+    conn.execute(
+        _rollup_upsert(conn, "weather_daily", "day"),
+        rollup_rows(rows, lambda dt: dt.date())
+    )
+
+def write_history_rows(conn, rows):
+    """
+    Inserts raw rows and folds them into the rollups atomically
+    (a savepoint, so a failed batch can be retried row by row).
+    """
+    rows = [{**row, "dt": _wall_clock(row["dt"])} for row in rows]
+    for row in rows:
+        row["day_part"] = day_part(row["dt"])
+    with conn.begin_nested():
+        conn.execute(INSERT_HISTORY_SQL, rows)
+        update_rollups(conn, rows)
+
+def history_writer(conn, batch_size=INSERT_BATCH_SIZE):
+    """
+    BatchWriter for weather_history rows on an open SQLAlchemy connection.
+    """
+    return BatchWriter(
+        lambda rows: write_history_rows(conn, rows),
+        batch_size=batch_size,
+        describe=lambda row: f"{row['city']},{row['country']}"
+    )
+
+def insert_sample_past_data(engine, country, city):
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("""
+                SELECT COUNT(*) FROM weather_history
+                WHERE country=:country AND city=:city
+            """),
+            {"country": country, "city": city}
+        ).scalar()
+        print(result)
+
+        if result > 5:
+            return
+
+        import numpy as np
+
+        with history_writer(conn) as writer:
+            for day in range(7, 0, -1):
+                base_date = datetime.now(IST) - pd.Timedelta(days=day)
+
+                for hour in [0, 6, 12, 18]:      # 4 records per day (every 6 hours)
+                    record_time = base_date.replace(
+                        hour=hour,
+                        minute=0,
+                        second=0,
+                        microsecond=0
+                    )
+
+                    writer.add({
+                        "country": country,
+                        "city": city,
+                        "temperature": np.random.uniform(22, 32),
+                        "humidity": np.random.uniform(50, 80),
+                        "wind": np.random.uniform(2, 6),
+                        "dt": record_time
+                    })
+
+def fetch_live_weather(city, country_code, API_KEY):
+    """
+    Fetches live weather for ONE city.
+    Returns None on a bad response so one city can't break the batch.
+    """
+    try:
+        res = api_get(
+            "weather",
+            {"q": f"{city},{country_code}", "appid": API_KEY, "units": "metric"}
+        )
+    except ApiError:
+        return None
+
+    if "main" not in res:
+        return None  # Skip invalid response
+
+    return res
+
+LAST_INGESTED_SQL = text("""
+    SELECT country, city, MAX(Dates_times)
+    FROM weather_history
+    GROUP BY country, city
+""")
+
+def _as_ist(value):
+    ts = pd.to_datetime(value)
+    return ts.tz_convert(IST) if ts.tzinfo else ts.tz_localize(IST)
+
+def load_last_ingested(engine):
+    """
+    Last stored Dates_times for EVERY city in one grouped query.
+    Returns {(country, city): IST-aware datetime}.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(LAST_INGESTED_SQL).fetchall()
+
+    return {
+        (country, city): _as_ist(last_time)
+        for country, city, last_time in rows
+        if last_time is not None
+    }
+
+# -------------------------------------------------
+# SINKS (tables fed by one live fetch)
+# -------------------------------------------------
+INSERT_WEATHER_DATA_SQL = text("""
+    INSERT INTO weather_data (
+        city, country, temperature_c, feels_like_c,
+        humidity_percent, pressure_hpa, wind_speed_mps,
+        weather_condition, weather_description, recorded_at
+    )
+    VALUES (:city, :country, :temperature_c, :feels_like_c,
+            :humidity_percent, :pressure_hpa, :wind_speed_mps,
+            :weather_condition, :weather_description, :recorded_at)
+""")
+
+def history_row(job, res, now):
+    country, _, city = job
+    return {
+        "country": country,
+        "city": city,
+        "temperature": res["main"]["temp"],
+        "humidity": res["main"]["humidity"],
+        "wind": res["wind"]["speed"],
+        "dt": now
+    }
+
+def weather_data_row(job, res, now):
+    # Same city name as weather_history; country stays the ISO code
+    _, country_code, city = job
+    return {
+        "city": city,
+        "country": country_code,
+        "temperature_c": round(res["main"]["temp"], 2),
+        "feels_like_c": round(res["main"]["feels_like"], 2),
+        "humidity_percent": res["main"]["humidity"],
+        "pressure_hpa": res["main"]["pressure"],
+        "wind_speed_mps": res["wind"]["speed"],
+        "weather_condition": res["weather"][0]["main"],
+        "weather_description": res["weather"][0]["description"],
+        "recorded_at": _wall_clock(now)
+    }
+
+def write_weather_data_rows(conn, rows):
+    with conn.begin_nested():
+        conn.execute(INSERT_WEATHER_DATA_SQL, rows)
+
+# table → (row(job, response, now), write(conn, rows)); add a table here
+# and every live fetch fans out to it too
+SINKS = {
+    "weather_history": (history_row, write_history_rows),
+    "weather_data": (weather_data_row, write_weather_data_rows),
+}
+
+INGEST_TABLES = [
+    t.strip() for t in os.getenv("INGEST_TABLES", ",".join(SINKS)).split(",") if t.strip()
+]
+
+class SinkWriter:
+    """
+    One BatchWriter per table on a shared connection; add() takes the
+    (table, job, row) triples produced for each fetched city, and
+    complete() lists the jobs whose rows reached EVERY table.
+    """
+
+    def __init__(self, conn, tables, batch_size=INSERT_BATCH_SIZE):
+        self.tables = list(tables)
+        self.stored = {table: set() for table in self.tables}
+        self.writers = {}
+        for table in self.tables:
+            self.writers[table] = BatchWriter(
+                lambda items, table=table: self._write(conn, table, items),
+                batch_size=batch_size,
+                describe=lambda item, table=table: f"{item[1]['city']},{item[1]['country']} ({table})"
+            )
+
+    def _write(self, conn, table, items):
+        with timer("ingest_insert", table=table):
+            SINKS[table][1](conn, [row for _, row in items])
+        # Only reached when the batch (or the single retried row) went in
+        self.stored[table].update(job for job, _ in items)
+
+    def add(self, triple):
+        table, job, row = triple
+        self.writers[table].add((job, row))
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def complete(self):
+        return set.intersection(*self.stored.values()) if self.tables else set()
+
+    @property
+    def written(self):
+        return {table: w.written for table, w in self.writers.items()}
+
+
+def store_live_weather_all_cities(engine, country_city, API_KEY, INTERVAL_MINUTES,
+                                  max_workers=FETCH_CONCURRENCY, last_seen=None,
+                                  mode=INGEST_MODE, demand=None, tables=None,
+                                  batch_size=INSERT_BATCH_SIZE, budget=None):
+    """
+    Single-pass live ingestion: every due city is fetched ONCE and its
+    response is written to every table in `tables` (default
+    INGEST_TABLES: weather_history + weather_data), all in a single
+    transaction.
+
+    Due cities come from the per-city INTERVAL_MINUTES gap check,
+    ordered by staleness (and by view demand when demand from
+    scheduler.load_demand() is passed) and capped to the API tokens
+    left (or to `budget` calls; math.inf fetches every due city, each
+    call waiting on API_BUCKET); see scheduler.plan_fetches.
+
+    Fetch, parse and batched writes overlap (ingest_pipeline), with at
+    most max_workers requests in flight, or 20 cities per call when
+    mode="group".
+
+    last_seen is the {(country, city): last time} index from
+    load_last_ingested(). Pass the same dict on every call to skip the
+    lookup query entirely; it is updated in place after each commit.
+    Returns {table: rows written}.
+    """
+    # ingest_pipeline imports this module
+    from ingest_pipeline import run_pipeline
+
+    tables = INGEST_TABLES if tables is None else tables
+    now = datetime.now(IST)
+
+    # 1️⃣ Last stored time for ALL cities (one round-trip at most)
+    if last_seen is None:
+        last_seen = load_last_ingested(engine)
+
+    # 2️⃣ INTERVAL_MINUTES gap check + priority order + rate-limit budget
+    candidates = [
+        (country, info["code"], city)
+        for country, info in country_city.items()
+        for city in info["cities"]
+    ]
+    due = plan_fetches(
+        candidates, last_seen, now, INTERVAL_MINUTES, demand,
+        budget=budget, per_call=cities_per_call(mode)
+    )
+
+    if not due or not tables:
+        return {}
+
+    # 3️⃣ Fetch each due city once, fan the response out to every table
+    def fan_out(job, res):
+        if res is None:
+            raise ValueError("no valid response")
+        return [(table, job, SINKS[table][0](job, res, now)) for table in tables]
+
+    if mode == "group":
+        items = [due[i:i + GROUP_SIZE] for i in range(0, len(due), GROUP_SIZE)]
+
+        def fetch(chunk):
+            with timer("ingest_fetch", mode=mode):
+                return fetch_current_many(
+                    [(city, country_code) for _, country_code, city in chunk], API_KEY
+                )
+
+        def parse(chunk, found):
+            for job in chunk:
+                res = found.get((job[2], job[1]))
+                if res is None:
+                    print(f"Error for {job[2]},{job[1]}: not returned by /group")
+                    continue
+                yield from fan_out(job, res)
+    else:
+        items = due
+
+        def fetch(job):
+            with timer("ingest_fetch", mode=mode):
+                return fetch_live_weather(job[2], job[1], API_KEY)
+
+        def parse(job, res):
+            return fan_out(job, res)
+
+    # 4️⃣ Every table written in ONE transaction, in batches
+    with engine.begin() as conn:
+        writer = SinkWriter(conn, tables, batch_size)
+        run_pipeline(items, fetch, parse, writer, fetch_workers=max_workers)
+        stored = writer.complete()
+    print(f"Ingested {len(stored)} cities into {', '.join(tables)} "
+          f"({len(due) - len(stored)} failed)")
+
+    # Keep the in-process index in step with what was just committed;
+    # a city missing from any table stays due for the next tick
+    for country, _, city in stored:
+        last_seen[(country, city)] = now
+    return writer.written
+
+
+# -------------------------------------------------
+# FORECASTS (weather_forecast, refreshed every 3 hours)
+# -------------------------------------------------
+LAST_FORECAST_SQL = text("""
+    SELECT country, city, MAX(fetched_at)
+    FROM weather_forecast
+    GROUP BY country, city
+""")
+
+DELETE_FORECAST_SQL = text("""
+    DELETE FROM weather_forecast WHERE country = :country AND city = :city
+""")
+
+INSERT_FORECAST_SQL = text("""
+    INSERT INTO weather_forecast
+    (country, city, forecast_time, temperature, day_part, fetched_at)
+    VALUES (:country, :city, :forecast_time, :temperature, :day_part, :fetched_at)
+""")
+
+def forecast_frame(res):
+    """
+    /forecast response → DataFrame[forecast_time (naive IST), temperature,
+    day_part], converting every timestamp in one vectorized call.
+    """
+    items = res.get("list", [])
+    times = (
+        pd.to_datetime([item["dt"] for item in items], unit="s", utc=True)
+        .tz_convert(IST)
+        .tz_localize(None)
+    )
+    return pd.DataFrame({
+        "forecast_time": times,
+        "temperature": [item["main"]["temp"] for item in items],
+        "day_part": times.hour // DAY_PART_HOURS,
+    })
+
+def load_last_forecast(engine):
+    """{(country, city): IST-aware time of the stored forecast}."""
+    with engine.connect() as conn:
+        rows = conn.execute(LAST_FORECAST_SQL).fetchall()
+
+    return {
+        (country, city): _as_ist(fetched_at)
+        for country, city, fetched_at in rows
+        if fetched_at is not None
+    }
+
+def _fetch_forecast(city, country_code, API_KEY):
+    try:
+        res = api_get(
+            "forecast",
+            {"q": f"{city},{country_code}", "appid": API_KEY, "units": "metric"}
+        )
+    except ApiError:
+        return None
+    return res if "list" in res else None
+
+def store_forecasts_all_cities(engine, country_city, API_KEY,
+                               max_workers=FETCH_CONCURRENCY, last_fetched=None,
+                               demand=None, interval_minutes=FORECAST_INTERVAL_MINUTES,
+                               budget=None):
+    """
+    Replaces the stored forecast of every city whose copy is older than
+    interval_minutes (most watched / stalest first, within the API
+    budget or `budget` calls). last_fetched works like last_seen in
+    store_live_weather_all_cities and is updated in place.
+    """
+    now = datetime.now(IST)
+    if last_fetched is None:
+        last_fetched = load_last_forecast(engine)
+
+    candidates = [
+        (country, info["code"], city)
+        for country, info in country_city.items()
+        for city in info["cities"]
+    ]
+    due = plan_fetches(candidates, last_fetched, now, interval_minutes, demand,
+                       budget=budget)
+    if not due:
+        return
+
+    workers = max(1, min(max_workers, len(due)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda job: _fetch_forecast(job[2], job[1], API_KEY), due))
+
+    fetched_at = _wall_clock(now)
+    with engine.begin() as conn:
+        for (country, _, city), res in zip(due, results):
+            if res is None:
+                continue
+            df = forecast_frame(res)
+            conn.execute(DELETE_FORECAST_SQL, {"country": country, "city": city})
+            if not df.empty:
+                conn.execute(INSERT_FORECAST_SQL, [
+                    {"country": country, "city": city, "forecast_time": t,
+                     "temperature": float(temp), "day_part": int(part),
+                     "fetched_at": fetched_at}
+                    for t, temp, part in zip(
+                        df["forecast_time"].dt.to_pydatetime(), df["temperature"], df["day_part"]
+                    )
+                ])
+            last_fetched[(country, city)] = now
+
+
+def backfill_all_cities(engine, country_city):
+    """
+    Seeds sample history for every city that has (almost) none yet.
+    """
+    for country, info in country_city.items():
+        for city in info["cities"]:
+            insert_sample_past_data(engine, country, city)
@@ -0,0 +1,354 @@
+import os
+import math
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import text, bindparam
+
+import history_cache
+from weather_api import ApiError, get_forecast_json
+from weather_ingest import IST, API_KEY, DAY_PART_HOURS, forecast_frame
+
+
+# Past trend: how far back to look and how many points to return at most
+PAST_WINDOW_DAYS = int(os.getenv("PAST_WINDOW_DAYS", "7"))
+PAST_TARGET_POINTS = int(os.getenv("PAST_TARGET_POINTS", "200"))
+
+# Dashboard "Time Range" option → weather_history.day_part (None = All)
+DAY_PARTS = {"All": None, "Night": 0, "Morning": 1, "Afternoon": 2, "Evening": 3}
+
+
+# -------------------------------------------------
+# DASHBOARD QUERIES (weather_history)
+# -------------------------------------------------
+# Every predicate is a plain range on Dates_times so MySQL can use the
+# (country, city, Dates_times) index added by migrate.py. Day bounds are
+# computed in IST by the caller (see today_params), matching how
+# Dates_times is stored. The TODAY_PART_SQL variant adds an equality on
+# day_part and uses the (country, city, day_part, Dates_times) index.
+
+# The week trend reads the weather_hourly rollup (at most 24 rows per
+# city per day) and merges whole hours into fixed-width buckets, so the
+# result never exceeds the target point count. sum/n keeps the average
+# exact however unevenly the hours were sampled.
+_PAST_WEEK = """
+    SELECT
+        MIN(hour_start) AS bucket_time,
+        ROUND(SUM(temp_sum) / SUM(n), 2) AS temperature
+    FROM weather_hourly
+    WHERE country=:country AND city=:city {part}
+      AND hour_start >= :since
+    GROUP BY FLOOR(UNIX_TIMESTAMP(hour_start) / :bucket)
+    ORDER BY bucket_time
+"""
+PAST_WEEK_SQL = text(_PAST_WEEK.format(part=""))
+# Day parts are whole hours (DAY_PART_HOURS divides 24)
+PAST_WEEK_PART_SQL = text(_PAST_WEEK.format(
+    part="AND FLOOR(HOUR(hour_start) / :part_hours) = :day_part"
+))
+
+_TODAY = """
+    SELECT Dates_times, temperature AS temperature
+    FROM weather_history
+    WHERE country = :country
+      AND city = :city {part}
+      AND Dates_times >= :day_start
+      AND Dates_times < :day_end
+    ORDER BY Dates_times
+"""
+TODAY_SQL = text(_TODAY.format(part=""))
+TODAY_PART_SQL = text(_TODAY.format(part="AND day_part = :day_part"))
+
+# Today's series for several cities in ONE round-trip (long format)
+TODAY_MANY_SQL = text("""
+    SELECT city, Dates_times, temperature AS temperature
+    FROM weather_history
+    WHERE country = :country
+      AND city IN :cities
+      AND Dates_times >= :day_start
+      AND Dates_times < :day_end
+    ORDER BY city, Dates_times
+""").bindparams(bindparam("cities", expanding=True))
+
+# Newest reading among the watched cities (index-only group-by)
+WATERMARK_SQL = text("""
+    SELECT city, MAX(Dates_times)
+    FROM weather_history
+    WHERE country = :country
+      AND city IN :cities
+    GROUP BY city
+""").bindparams(bindparam("cities", expanding=True))
+
+# Daily cards and today's stats read the rollups kept by ingestion,
+# a handful of rows regardless of how often cities are sampled
+PAST_DAILY_AVG_SQL = text("""
+    SELECT
+        day,
+        ROUND(temp_sum / n, 1) AS avg_temp
+    FROM weather_daily
+    WHERE country = :c
+      AND city = :ci
+      AND day < :today     -- ❌ exclude today
+    ORDER BY day DESC
+    LIMIT :d
+""")
+
+TODAY_STATS_SQL = text("""
+    SELECT n, temp_min, temp_max, temp_sum / n AS temp_avg
+    FROM weather_daily
+    WHERE country = :country
+      AND city = :city
+      AND day = :today
+""")
+
+
+def past_window_params(country, city, days=PAST_WINDOW_DAYS, points=PAST_TARGET_POINTS):
+    since = datetime.now(IST).replace(tzinfo=None, minute=0, second=0, microsecond=0) \
+        - timedelta(days=days)
+    # Whole hours, the grain of weather_hourly (seconds)
+    bucket = 3600 * max(1, math.ceil(days * 24 / max(1, points)))
+    return {"country": country, "city": city, "since": since, "bucket": bucket}
+
+def _use_local(engine):
+    """
+    True when the local Parquet mirror is enabled and has data. Syncing
+    runs on its own thread; until the first sync lands, the DB is read.
+    """
+    if not history_cache.enabled():
+        return False
+    history_cache.start_sync(engine)
+    return history_cache.ready()
+
+def _today_bounds():
+    start = datetime.now(IST).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+def today_params(country, city):
+    start, end = _today_bounds()
+    return {"country": country, "city": city, "day_start": start, "day_end": end}
+
+def _local_day_part(df, part):
+    # The Parquet mirror has no day_part column; derive it from the hour
+    if part is None:
+        return df
+    return df[df["Dates_times"].dt.hour // DAY_PART_HOURS == part].reset_index(drop=True)
+
+def get_past_week(engine, country, city, days=PAST_WINDOW_DAYS, points=PAST_TARGET_POINTS,
+                  part=None):
+    """
+    Temperature over the last `days`, downsampled to at most `points`
+    bucket averages of one or more whole hours (weather_hourly).
+    part: a DAY_PARTS value to keep only that part of each day.
+    """
+    if _use_local(engine):
+        params = past_window_params(country, city, days, points)
+        df = _local_day_part(
+            history_cache.read_history(country, [city], start=params["since"]), part
+        )
+        bucket = (df["Dates_times"] - pd.Timestamp(0)) // pd.Timedelta(seconds=params["bucket"])
+        return (
+            df.groupby(bucket)
+            .agg(Dates_times=("Dates_times", "min"), temperature=("temperature", "mean"))
+            .round({"temperature": 2})
+            .reset_index(drop=True)
+        )
+
+    params = past_window_params(country, city, days, points)
+    if part is not None:
+        params.update(day_part=part, part_hours=DAY_PART_HOURS)
+
+    df = pd.read_sql(
+        PAST_WEEK_SQL if part is None else PAST_WEEK_PART_SQL,
+        engine,
+        params=params
+    )
+    df = df.rename(columns={"bucket_time": "Dates_times"})
+    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
+    return df
+
+def get_today_weather(engine, country, city, part=None):
+    if _use_local(engine):
+        return _local_day_part(get_today_weather_many(engine, country, [city])[city], part)
+
+    params = today_params(country, city)
+    if part is not None:
+        params["day_part"] = part
+
+    df = pd.read_sql(
+        TODAY_SQL if part is None else TODAY_PART_SQL,
+        engine,
+        params=params
+    )
+
+    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
+    return df
+
+def get_today_weather_many(engine, country, cities):
+    """
+    Today's readings for every city in `cities` with a single IN (...)
+    query. Returns {city: frame} with the same columns as
+    get_today_weather (cities with no rows get an empty frame).
+    """
+    cities = list(dict.fromkeys(cities))
+    if _use_local(engine):
+        start, end = _today_bounds()
+        df = history_cache.read_history(
+            country, cities, start, end, columns=("city", "Dates_times", "temperature")
+        )
+    else:
+        start, end = _today_bounds()
+        df = pd.read_sql(
+            TODAY_MANY_SQL,
+            engine,
+            params={"country": country, "cities": cities,
+                    "day_start": start, "day_end": end}
+        )
+    df["Dates_times"] = pd.to_datetime(df["Dates_times"])
+
+    by_city = {
+        city: group.drop(columns="city").reset_index(drop=True)
+        for city, group in df.groupby("city", sort=False)
+    }
+    empty = df.drop(columns="city").iloc[0:0]
+    return {city: by_city.get(city, empty) for city in cities}
+
+def get_watermark(engine, country, cities):
+    """
+    Latest Dates_times across `cities` (None if they have no rows).
+    Cheap enough to poll: it only changes when ingestion writes (or,
+    with the mirror, when a sync brings those rows in).
+    """
+    if _use_local(engine):
+        start = _today_bounds()[0] - timedelta(days=1)
+        df = history_cache.read_history(country, cities, start=start, columns=("Dates_times",))
+        return None if df.empty else df["Dates_times"].iloc[-1].to_pydatetime()
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            WATERMARK_SQL, {"country": country, "cities": list(cities)}
+        ).fetchall()
+
+    times = [last_time for _, last_time in rows if last_time is not None]
+    return max(times) if times else None
+
+def get_past_daily_avg(engine, country, city, days=5):
+    if _use_local(engine):
+        start, end = _today_bounds()
+        df = history_cache.read_history(
+            country, [city], start - timedelta(days=days), start
+        )
+        return (
+            df.groupby(df["Dates_times"].dt.date)["temperature"]
+            .mean()
+            .round(1)
+            .rename_axis("day")
+            .reset_index(name="avg_temp")
+            .sort_values("day", ascending=False)
+            .head(days)
+            .reset_index(drop=True)
+        )
+
+    df = pd.read_sql(
+        PAST_DAILY_AVG_SQL,
+        engine,
+        params={"c": country, "ci": city, "d": days,
+                "today": _today_bounds()[0].date()}
+    )
+
+    # Reverse so it shows Thu → Mon (left to right)
+    return df
+
+def get_today_stats(engine, country, city):
+    """
+    Today's count/min/max/avg temperature from weather_daily, or from
+    the mirror when enabled (None when nothing has been recorded today).
+    """
+    if _use_local(engine):
+        start, end = _today_bounds()
+        temps = history_cache.read_history(country, [city], start, end)["temperature"]
+        if temps.empty:
+            return None
+        return {"n": len(temps), "temp_min": float(temps.min()),
+                "temp_max": float(temps.max()), "temp_avg": float(temps.mean())}
+
+    with engine.connect() as conn:
+        row = conn.execute(
+            TODAY_STATS_SQL,
+            {"country": country, "city": city, "today": _today_bounds()[0].date()}
+        ).mappings().first()
+
+    return dict(row) if row else None
+
+
+# -------------------------------------------------
+# FORECAST (weather_forecast, refreshed by the ingestion service)
+# -------------------------------------------------
+FORECAST_SQL = text("""
+    SELECT forecast_time, temperature AS temperature, day_part
+    FROM weather_forecast
+    WHERE country = :country AND city = :city
+      AND forecast_time >= :now          -- stored copy can be hours old
+    ORDER BY forecast_time
+""")
+
+FUTURE_DAILY_AVG_SQL = text("""
+    SELECT DATE(forecast_time) AS day, ROUND(AVG(temperature), 1) AS avg_temp
+    FROM weather_forecast
+    WHERE country = :country AND city = :city
+      AND forecast_time >= :tomorrow     -- ❌ exclude today
+    GROUP BY DATE(forecast_time)
+    ORDER BY day
+    LIMIT :d
+""")
+
+_FORECAST_COLUMNS = {"forecast_time": "Date & Time", "temperature": "Temperature (°C)"}
+
+# Render-time fallback: never block a page long on the API budget
+API_FALLBACK_WAIT_SECONDS = 2
+
+def _api_forecast(city, country_code, api_key):
+    # Until the service has stored this city: the cached /forecast call.
+    # No token or no network → empty frame; the page shows a warning.
+    try:
+        res = get_forecast_json(city, country_code, api_key, wait=API_FALLBACK_WAIT_SECONDS)
+    except ApiError as e:
+        print(f"Forecast unavailable for {city},{country_code}: {e}")
+        res = {}
+    return forecast_frame(res)
+
+def get_forecast(engine, country, city, country_code, api_key=API_KEY):
+    """
+    5-day / 3-hour forecast as DataFrame["Date & Time",
+    "Temperature (°C)", "day_part"], read from weather_forecast.
+    Slots already in the past are left out.
+    """
+    now = datetime.now(IST).replace(tzinfo=None)
+    df = pd.read_sql(
+        FORECAST_SQL, engine, params={"country": country, "city": city, "now": now}
+    )
+    if df.empty:
+        df = _api_forecast(city, country_code, api_key)
+
+    df["forecast_time"] = pd.to_datetime(df["forecast_time"])
+    return df.rename(columns=_FORECAST_COLUMNS)
+
+def get_future_daily_avg(engine, country, city, country_code, days=5, api_key=API_KEY):
+    """Average forecast temperature for each of the next `days` days (from tomorrow)."""
+    tomorrow = _today_bounds()[1]
+    df = pd.read_sql(
+        FUTURE_DAILY_AVG_SQL,
+        engine,
+        params={"country": country, "city": city, "tomorrow": tomorrow, "d": days}
+    )
+
+    if df.empty:
+        f = _api_forecast(city, country_code, api_key)
+        f = f[f["forecast_time"] >= tomorrow]
+        df = (
+            f.groupby(f["forecast_time"].dt.date)["temperature"]
+            .mean()
+            .round(1)
+            .rename_axis("day")
+            .reset_index(name="avg_temp")
+            .head(days)
+        )
+    return df